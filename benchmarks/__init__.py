@@ -0,0 +1,8 @@
+"""
+Benchmarks of the dataset synthesis, channel, storage and training input hot
+paths. Run them with
+
+    python -m benchmarks --sizes 1000 100000 --output results.json
+
+and compare against a stored run with --baseline.
+"""
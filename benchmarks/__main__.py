@@ -0,0 +1,72 @@
+import fnmatch
+import sys
+from argparse import ArgumentParser
+from benchmarks import harness
+from benchmarks.cases import CASES
+
+# Dataset sizes in 128-sample vectors. The largest matches a million-vector
+# dataset
+PRESETS = {
+    'small': [128, 1000],
+    'medium': [1000, 10**5],
+    'large': [10**5, 10**6],
+}
+
+
+def argument_parser():
+    parser = ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmark synthesis, channel, storage and training input')
+    parser.add_argument('--cases', nargs='+', default=['*'],
+                        help='Glob patterns of the cases to run '
+                        '[default=%(default)s]')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        help='Dataset sizes (vectors) to run each case at')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small',
+                        help='Sizes to run if --sizes is not given '
+                        '[default=%(default)s]')
+    parser.add_argument('--repeats', type=int, default=5,
+                        help='Timed calls per measurement [default=%(default)r]')
+    parser.add_argument('--no-isolate', dest='isolate', action='store_false',
+                        help='Run every case in this process. Peak RSS is '
+                        'then the maximum over all cases so far')
+    parser.add_argument('--output',
+                        help='Write the results to this JSON file')
+    parser.add_argument('--baseline',
+                        help='Compare the results against this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Relative throughput drop reported as a '
+                        'regression [default=%(default)r]')
+    parser.add_argument('--list', action='store_true',
+                        help='List the cases and exit')
+    return parser
+
+
+def main(options=None):
+    args = options if options is not None else argument_parser().parse_args()
+    cases = [case for case in CASES
+             if any(fnmatch.fnmatch(case.name, pattern) for pattern in args.cases)]
+    if args.list:
+        for case in cases:
+            print(case.name)
+        return 0
+    sizes = args.sizes or PRESETS[args.preset]
+    results = harness.run(cases, sizes, repeats=args.repeats,
+                          isolate=args.isolate)
+    comparison = None
+    if args.baseline:
+        comparison = harness.compare(results, harness.load(args.baseline),
+                                     args.tolerance)
+        for entry in comparison:
+            flag = '  REGRESSION' if entry['regression'] else ''
+            print(f"{entry['case']:<36} {entry['size']:>9} "
+                  f"{entry['ratio']:>6.2f}x baseline{flag}")
+    if args.output:
+        harness.save(args.output, results, comparison)
+    if comparison and any(entry['regression'] for entry in comparison):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,346 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from sigmf import SigMFFile
+from signals.channel import BatchChannel
+from signals.dataset import SigMFDataset
+from signals.detail import detail
+from signals.features import FEATURES
+from signals.index import INDEX_EXTENSION, DatasetIndex
+from signals.storage import SigMFWriter
+from signals.synthesis import DatasetSynthesizer
+from signals.waveform import LinearFMWaveform, SquareWaveform, bpsk, qpsk, \
+    psk8, qam16
+
+# Parameters shared by every case, from the synthesis notebook
+N_SAMPS_VEC = 128
+SAMP_RATE = 20e6
+NOISE_VOLTAGE = 1.0
+# Vectors processed per call of the batched implementations, so memory use
+# does not grow with the dataset size
+BLOCK_SIZE = 10000
+COMMUNICATIONS = {'bpsk': bpsk, 'qpsk': qpsk, '8psk': psk8, '16qam': qam16}
+
+
+class Case():
+    """
+    A benchmark case
+
+    Parameters
+    ----------
+      - name: The name the case is reported under
+      - setup: A module-level function taking the size (in vectors) and the
+        extra arguments, which returns (fn, nItems, cleanup). fn is the timed
+        function, nItems the number of samples it processes per call and
+        cleanup a function to call when the case is done (or None)
+      - args: Extra (picklable) arguments passed to setup
+      - maxSize: The largest size the case is run at, or None for no limit.
+        Used for cases that loop over vectors in Python
+    """
+
+    def __init__(self, name, setup, args=(), maxSize=None):
+        self.name = name
+        self._setup = setup
+        self.args = args
+        self.maxSize = maxSize
+
+    def setup(self, size):
+        return self._setup(size, *self.args)
+
+
+def _blocks(size):
+    """
+    Split size vectors into blocks of at most BLOCK_SIZE vectors
+    """
+    return [min(BLOCK_SIZE, size - start) for start in range(0, size, BLOCK_SIZE)]
+
+
+def _metadata(label, iVec):
+    """
+    Annotation metadata like the synthesis notebook writes for each vector
+    """
+    return {SigMFFile.LABEL_KEY: label,
+            detail.DETAIL_KEY: {detail.NOISE_VOLTAGE_KEY: float(iVec % 11)}}
+
+
+def _temporary_recording(size, annotations=True, index=True):
+    """
+    Write a recording of size random vectors to a temporary directory
+
+    Returns
+    -------
+      - filename: The recording path, without the SigMF extension
+      - cleanup: A function that removes the recording
+    """
+    directory = tempfile.mkdtemp(prefix='signals-benchmark-')
+    filename = os.path.join(directory, 'recording')
+    rng = np.random.default_rng(0)
+    labels = ['LFM', 'Square', 'BPSK', 'QPSK', '8PSK', '16QAM']
+    with SigMFWriter(filename, {}, annotations=annotations,
+                     index=index) as writer:
+        for iBlock, nVecs in enumerate(_blocks(size)):
+            data = (rng.standard_normal((nVecs, N_SAMPS_VEC), np.float32) +
+                    1j*rng.standard_normal((nVecs, N_SAMPS_VEC), np.float32))
+            writer.append(data, [
+                _metadata(labels[(iBlock + iVec) % len(labels)], iVec)
+                for iVec in range(nVecs)])
+    return filename, lambda: shutil.rmtree(directory)
+
+
+# Waveforms
+
+def radar_sample(size, waveform):
+    """
+    Sample one radar pulse per vector, as done in the synthesis notebook
+    """
+    pulsewidth = N_SAMPS_VEC / SAMP_RATE
+    sig = waveform(bandwidth=10e6, pulsewidth=pulsewidth, sampRate=SAMP_RATE)
+
+    def fn():
+        for _ in range(size):
+            sig.sample()
+    return fn, size*len(sig.sample()), None
+
+
+def radar_sample_batch(size, waveform):
+    """
+    Sample one radar pulse per vector with the vectorized implementation
+    """
+    rng = np.random.default_rng(0)
+    bandwidths = rng.uniform(1e6, 10e6, size)
+    pulsewidths = np.full((size,), N_SAMPS_VEC / SAMP_RATE)
+
+    def fn():
+        for start in range(0, size, BLOCK_SIZE):
+            stop = start + BLOCK_SIZE
+            waveform.sample_batch(bandwidths[start:stop], pulsewidths[start:stop],
+                                  N_SAMPS_VEC, SAMP_RATE)
+    return fn, size*N_SAMPS_VEC, None
+
+
+def communications_transmitter(size, label):
+    """
+    Run the GNU Radio transmitter flowgraph once per vector, as done in the
+    synthesis notebook
+    """
+    from gnuradio import gr, blocks
+    sig = COMMUNICATIONS[label]()
+    tb = gr.top_block()
+    tx = sig.transmitter(nSamps=N_SAMPS_VEC)
+    sink = blocks.null_sink(gr.sizeof_gr_complex)
+    tb.connect(tx, sink)
+
+    def fn():
+        for _ in range(size):
+            tx.reset()
+            tb.run()
+    return fn, size*N_SAMPS_VEC, None
+
+
+def flowgraph_pool(size, label, nInstances=None):
+    """
+    Run a pool of transmitter -> channel -> sink flowgraphs to capture size
+    vectors. With one flowgraph per CPU, the speedup over a single flowgraph
+    shows how well the flowgraphs run concurrently
+    """
+    from signals.pool import FlowgraphPool
+    pool = FlowgraphPool(COMMUNICATIONS[label](), N_SAMPS_VEC, SAMP_RATE,
+                         20*np.log10(NOISE_VOLTAGE), nInstances=nInstances)
+
+    def fn():
+        pool.run(size)
+    return fn, size*N_SAMPS_VEC, pool.close
+
+
+def communications_sample_batch(size, label):
+    """
+    Modulate one vector of random data per row with the NumPy modulator
+    """
+    sig = COMMUNICATIONS[label]()
+
+    def fn():
+        for iBlock, nVecs in enumerate(_blocks(size)):
+            sig.sample_batch(nVecs, N_SAMPS_VEC, seed=iBlock)
+    return fn, size*N_SAMPS_VEC, None
+
+
+# Channel
+
+def channel(size):
+    """
+    Stream size vectors of samples through the GNU Radio channel model
+    """
+    from gnuradio import gr, blocks
+    from signals.channel import Channel
+    nSamps = size*N_SAMPS_VEC
+    tb = gr.top_block()
+    src = blocks.vector_source_c(
+        bpsk().sample_batch(1, 8192, seed=0)[0].tolist(), True)
+    chan = Channel(SAMP_RATE, 8, 1, True, 4, [0.0, 0.9, 1.3], [1, 0.99, 0.97],
+                   8, 20*np.log10(NOISE_VOLTAGE), 0)
+    head = blocks.head(gr.sizeof_gr_complex, nSamps)
+    sink = blocks.null_sink(gr.sizeof_gr_complex)
+    tb.connect(src, chan, head, sink)
+
+    def fn():
+        head.reset()
+        tb.run()
+    return fn, nSamps, None
+
+
+def batch_channel(size):
+    """
+    Apply the NumPy channel model to size vectors
+    """
+    chan = BatchChannel(SAMP_RATE, 0.01, 50, .01, 0.5e3, 8, 1, True, 4,
+                        [0.0, 0.9, 1.3], [1, 0.99, 0.97], 8)
+    data = bpsk().sample_batch(min(size, BLOCK_SIZE), N_SAMPS_VEC, seed=0)
+
+    def fn():
+        for iBlock, nVecs in enumerate(_blocks(size)):
+            chan.apply(data[:nVecs], np.full((nVecs,), NOISE_VOLTAGE), iBlock)
+    return fn, size*N_SAMPS_VEC, None
+
+
+# Synthesis
+
+def synthesis_shard(size, waveform):
+    """
+    Synthesize every vector of one (noise voltage x class) pair of the grid
+    """
+    synthesizer = DatasetSynthesizer(waveforms=[waveform],
+                                     noiseVoltages=[NOISE_VOLTAGE],
+                                     nVecClass=size, nSampsVec=N_SAMPS_VEC,
+                                     sampRate=SAMP_RATE, shardSize=BLOCK_SIZE)
+
+    def fn():
+        for shard in synthesizer.shards():
+            synthesizer.synthesize_shard(shard)
+    return fn, size*N_SAMPS_VEC, None
+
+
+# Storage
+
+def sigmf_write(size, annotations):
+    """
+    Write a recording of size vectors with SigMFWriter
+    """
+    directory = tempfile.mkdtemp(prefix='signals-benchmark-')
+    filename = os.path.join(directory, 'recording')
+    rng = np.random.default_rng(0)
+    nVecs = min(size, BLOCK_SIZE)
+    data = (rng.standard_normal((nVecs, N_SAMPS_VEC), np.float32) +
+            1j*rng.standard_normal((nVecs, N_SAMPS_VEC), np.float32))
+    metadata = [_metadata('QPSK', iVec) for iVec in range(nVecs)]
+
+    def fn():
+        with SigMFWriter(filename, {}, annotations=annotations) as writer:
+            for nVecs in _blocks(size):
+                writer.append(data[:nVecs], metadata[:nVecs])
+    return fn, size*N_SAMPS_VEC, lambda: shutil.rmtree(directory)
+
+
+def annotation_load(size):
+    """
+    Open a recording that has no index, so the labels are built from the
+    JSON annotations
+    """
+    filename, cleanup = _temporary_recording(size, index=False)
+
+    def fn():
+        SigMFDataset(filename).labelIds
+    return fn, size*N_SAMPS_VEC, cleanup
+
+
+def index_load(size):
+    """
+    Open a recording through its columnar index
+    """
+    filename, cleanup = _temporary_recording(size, annotations=False)
+    assert os.path.exists(filename + INDEX_EXTENSION)
+
+    def fn():
+        DatasetIndex.load(filename).labelId
+    return fn, size*N_SAMPS_VEC, cleanup
+
+
+# Training input
+
+def training_tensor(size):
+    """
+    Build shuffled float32 I/Q training batches from a memory-mapped recording
+    """
+    filename, cleanup = _temporary_recording(size, annotations=False)
+    dataset = SigMFDataset(filename)
+    order = np.random.default_rng(0).permutation(size)
+
+    def fn():
+        for start in range(0, size, 1024):
+            dataset.batch(np.sort(order[start:start+1024]))
+    return fn, size*N_SAMPS_VEC, cleanup
+
+
+def training_pipeline(size):
+    """
+    Iterate over one epoch of the tf.data input pipeline
+    """
+    from signals.pipeline import make_dataset
+    filename, cleanup = _temporary_recording(size, annotations=False)
+    dataset = make_dataset(filename, batchSize=1024, seed=0)
+
+    def fn():
+        for _ in dataset:
+            pass
+    return fn, size*N_SAMPS_VEC, cleanup
+
+
+# Features
+
+def feature_extraction(size, name):
+    """
+    Extract a feature from every vector of a recording in batches
+    """
+    filename, cleanup = _temporary_recording(size, annotations=False)
+    vectors = SigMFDataset(filename).vectors
+    extractor = FEATURES[name]
+
+    def fn():
+        for start in range(0, size, BLOCK_SIZE):
+            extractor(vectors[start:start+BLOCK_SIZE])
+    return fn, size*N_SAMPS_VEC, cleanup
+
+
+CASES = [
+    Case('waveform.lfm.sample', radar_sample, (LinearFMWaveform,), maxSize=10**5),
+    Case('waveform.square.sample', radar_sample, (SquareWaveform,), maxSize=10**5),
+    Case('waveform.lfm.sample_batch', radar_sample_batch, (LinearFMWaveform,)),
+    Case('waveform.square.sample_batch', radar_sample_batch, (SquareWaveform,)),
+] + [
+    Case(f'transmitter.{label}', communications_transmitter, (label,),
+         maxSize=10**4) for label in COMMUNICATIONS
+] + [
+    Case(f'transmitter.{label}.pool1', flowgraph_pool, (label, 1),
+         maxSize=10**4) for label in COMMUNICATIONS
+] + [
+    Case(f'transmitter.{label}.pool', flowgraph_pool, (label,),
+         maxSize=10**5) for label in COMMUNICATIONS
+] + [
+    Case(f'transmitter.{label}.sample_batch', communications_sample_batch,
+         (label,)) for label in COMMUNICATIONS
+] + [
+    Case('channel.gnuradio', channel),
+    Case('channel.numpy', batch_channel),
+] + [
+    Case(f'synthesis.shard.{waveform.__name__}', synthesis_shard, (waveform,))
+    for waveform in (LinearFMWaveform, SquareWaveform, bpsk, qpsk, psk8, qam16)
+] + [
+    Case('storage.sigmf_write', sigmf_write, (True,)),
+    Case('storage.sigmf_write.no_annotations', sigmf_write, (False,)),
+    Case('storage.annotation_load', annotation_load),
+    Case('storage.index_load', index_load),
+    Case('training.tensor', training_tensor),
+    Case('training.pipeline', training_pipeline),
+] + [
+    Case(f'features.{name}', feature_extraction, (name,)) for name in FEATURES
+]
@@ -0,0 +1,152 @@
+import json
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import numpy as np
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident set size of this process in MiB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB everywhere else
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def measure(fn, nItems, repeats=10, warmup=1, minTime=0.0):
+    """
+    Time repeated calls of fn
+
+    Parameters
+    ----------
+      - fn: A function with no arguments to time
+      - nItems: The number of samples (or vectors) processed per call
+      - repeats: The minimum number of timed calls
+      - warmup: The number of untimed calls made first
+      - minTime: Keep calling fn until at least this many seconds are timed
+
+    Returns
+    -------
+      - stats: Throughput, latency percentiles and peak RSS
+    """
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    total = 0.0
+    while len(latencies) < repeats or total < minTime:
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+        total += latencies[-1]
+    latencies = np.array(latencies)
+    return {
+        'items_per_call': nItems,
+        'calls': len(latencies),
+        'samples_per_sec': float(nItems / np.median(latencies)),
+        'latency_ms': {
+            'p50': float(1e3*np.percentile(latencies, 50)),
+            'p90': float(1e3*np.percentile(latencies, 90)),
+            'p99': float(1e3*np.percentile(latencies, 99)),
+            'max': float(1e3*latencies.max()),
+        },
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _run_case(case, size, repeats):
+    """
+    Set up and time a single case. Runs in a fresh worker process, so the
+    reported peak RSS belongs to this case alone
+    """
+    fn, nItems, cleanup = case.setup(size)
+    try:
+        stats = measure(fn, nItems, repeats=repeats)
+    finally:
+        if cleanup is not None:
+            cleanup()
+    stats.update({'case': case.name, 'size': size})
+    return stats
+
+
+def run(cases, sizes, repeats=10, isolate=True):
+    """
+    Run every case at every size
+
+    Parameters
+    ----------
+      - cases: The Case objects to run
+      - sizes: The dataset sizes (in vectors) to run each case at
+      - repeats: The minimum number of timed calls per measurement
+      - isolate: If true, run each measurement in its own process
+
+    Returns
+    -------
+      - results: A list with one stats dictionary per (case, size)
+    """
+    results = []
+    for case in cases:
+        for size in sizes:
+            if case.maxSize is not None and size > case.maxSize:
+                continue
+            if isolate:
+                with ProcessPoolExecutor(
+                        max_workers=1,
+                        mp_context=mp.get_context('spawn')) as executor:
+                    stats = executor.submit(_run_case, case, size, repeats).result()
+            else:
+                stats = _run_case(case, size, repeats)
+            print(f"{stats['case']:<36} {size:>9} "
+                  f"{stats['samples_per_sec']:>12.4g} samples/s  "
+                  f"p50 {stats['latency_ms']['p50']:>9.3f} ms  "
+                  f"p99 {stats['latency_ms']['p99']:>9.3f} ms  "
+                  f"{stats['peak_rss_mb']:>8.1f} MiB", flush=True)
+            results.append(stats)
+    return results
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Compare results against a baseline run
+
+    Parameters
+    ----------
+      - results: The results of run()
+      - baseline: The results of an earlier run()
+      - tolerance: The relative throughput drop that counts as a regression
+
+    Returns
+    -------
+      - comparison: One entry per (case, size) found in both runs, with the
+        throughput ratio and whether it regressed
+    """
+    reference = {(r['case'], r['size']): r for r in baseline}
+    comparison = []
+    for result in results:
+        key = (result['case'], result['size'])
+        if key not in reference:
+            continue
+        ratio = float(result['samples_per_sec'] /
+                      reference[key]['samples_per_sec'])
+        comparison.append({'case': key[0], 'size': key[1], 'ratio': ratio,
+                           'regression': ratio < 1 - tolerance})
+    return comparison
+
+
+def save(filename, results, comparison=None):
+    """
+    Write results (and an optional baseline comparison) as JSON
+    """
+    with open(filename, 'w') as resultFile:
+        json.dump({'results': results, 'comparison': comparison},
+                  resultFile, indent=2)
+
+
+def load(filename):
+    """
+    Load the results of a run saved with save()
+    """
+    with open(filename) as resultFile:
+        return json.load(resultFile)['results']
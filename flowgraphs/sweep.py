@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless impairment sweep
+
+Builds a random data -> modulator -> impairment -> file sink flowgraph for
+each impairment value, runs it without any GUI, and writes the captured IQ
+along with the measured throughput of the chain and of each block.
+
+Example (from the repository root):
+
+    python -m flowgraphs.sweep --impairment awgn --values 0.01 0.1 1 \
+        --waveform qpsk --nsamps 1000000 --output sweeps/awgn
+"""
+
+import json
+import os
+import time
+from argparse import ArgumentParser
+from gnuradio import gr, blocks, analog, channels
+from gnuradio.eng_arg import eng_float, intx
+from signals.constellation import registry
+from signals.profiling import block_counters, enable_performance_counters
+from signals.waveform import bpsk, qpsk, psk8, qam16
+
+WAVEFORMS = {'bpsk': bpsk, 'qpsk': qpsk, '8psk': psk8, '16qam': qam16}
+IMPAIRMENTS = ('awgn', 'cfo', 'sro')
+
+
+class ImpairmentFlowgraph(gr.top_block):
+    """
+    A flowgraph that modulates random data, applies a single impairment and
+    writes nSamps impaired samples to a file
+
+    Parameters
+    ----------
+      - waveform: The CommunicationsWaveform to modulate
+      - impairment: One of 'awgn', 'cfo' or 'sro'
+      - value: The impairment value. For 'awgn' this is the noise voltage, for
+        'cfo' and 'sro' the standard deviation of the random walk step (Hz)
+      - sampRate: The sample rate (Hz)
+      - nSamps: The number of samples to capture
+      - filename: The file the impaired samples are written to
+      - maxDev: Maximum frequency deviation of the 'cfo' and 'sro' models (Hz)
+      - seed: The seed of the data and noise sources
+    """
+
+    def __init__(self, waveform, impairment, value, sampRate, nSamps, filename,
+                 maxDev=50, seed=0):
+        gr.top_block.__init__(self, 'ImpairmentFlowgraph', catch_exceptions=True)
+        self.src = analog.random_uniform_source_b(0, 256, seed)
+        self.modulator = registry.modulator(waveform, shared=False)
+        self.head = blocks.head(gr.sizeof_gr_complex, int(nSamps))
+        self.sink = blocks.file_sink(gr.sizeof_gr_complex, filename, False)
+        self.sink.set_unbuffered(False)
+        if impairment == 'awgn':
+            self.noise = analog.noise_source_c(analog.GR_GAUSSIAN, value, seed)
+            self.impairment = blocks.add_cc()
+            self.connect(self.src, self.modulator, (self.impairment, 0))
+            self.connect(self.noise, (self.impairment, 1))
+        elif impairment == 'cfo':
+            self.impairment = channels.cfo_model(sampRate, value, maxDev, seed)
+            self.connect(self.src, self.modulator, self.impairment)
+        elif impairment == 'sro':
+            self.impairment = channels.sro_model(sampRate, value, maxDev, seed)
+            self.connect(self.src, self.modulator, self.impairment)
+        else:
+            raise ValueError(f'Unknown impairment {impairment}')
+        self.connect(self.impairment, self.head, self.sink)
+
+    def counted_blocks(self):
+        """
+        Return the (name, block) pairs of the blocks in the flowgraph, for
+        block_counters()
+        """
+        named = [('source', self.src),
+                 ('impairment', self.impairment),
+                 ('head', self.head),
+                 ('sink', self.sink)]
+        # The modulator is a hierarchical block, so report its children
+        for name in ('bytes2chunks', 'symbol_mapper', 'diffenc',
+                     'chunks2symbols', 'rrc_filter'):
+            if hasattr(self.modulator, name):
+                named.append(('modulator.' + name, getattr(self.modulator, name)))
+        if hasattr(self, 'noise'):
+            named.append(('noise', self.noise))
+        return named
+
+
+def run_point(waveform, impairment, value, args):
+    """
+    Run the flowgraph for a single impairment value and return its
+    measurements
+    """
+    filename = os.path.join(args.output, f'{impairment}_{value:g}.cf32')
+    tb = ImpairmentFlowgraph(waveform, impairment, value, args.samp_rate,
+                             args.nsamps, filename, args.max_dev, args.seed)
+    wallStart = time.perf_counter()
+    cpuStart = time.process_time()
+    tb.run()
+    elapsed = time.perf_counter() - wallStart
+    cpu = time.process_time() - cpuStart
+    return {
+        'impairment': impairment,
+        'value': value,
+        'file': os.path.basename(filename),
+        'nsamps': args.nsamps,
+        'wall_time_s': elapsed,
+        'cpu_time_s': cpu,
+        'samples_per_sec': args.nsamps / elapsed if elapsed > 0 else None,
+        'blocks': block_counters(tb.counted_blocks()),
+    }
+
+
+def argument_parser():
+    parser = ArgumentParser(description='Headless modulator impairment sweep')
+    parser.add_argument('--impairment', choices=IMPAIRMENTS, required=True,
+                        help='The impairment to sweep')
+    parser.add_argument('--values', type=eng_float, nargs='+', required=True,
+                        help='Impairment values: noise voltage for awgn, '
+                        'random walk standard deviation (Hz) for cfo and sro')
+    parser.add_argument('--waveform', choices=sorted(WAVEFORMS), default='qpsk',
+                        help='The modulation to transmit [default=%(default)s]')
+    parser.add_argument('--samp-rate', type=eng_float, default=32000,
+                        help='Sample rate (Hz) [default=%(default)r]')
+    parser.add_argument('--nsamps', type=intx, default=1000000,
+                        help='Samples captured per value [default=%(default)r]')
+    parser.add_argument('--max-dev', type=eng_float, default=50,
+                        help='Maximum cfo/sro deviation (Hz) [default=%(default)r]')
+    parser.add_argument('--sps', type=intx, default=2,
+                        help='Samples per symbol [default=%(default)r]')
+    parser.add_argument('--excess-bw', type=eng_float, default=0.35,
+                        help='RRC excess bandwidth [default=%(default)r]')
+    parser.add_argument('--no-differential', dest='differential',
+                        action='store_false',
+                        help='Disable differential encoding')
+    parser.add_argument('--seed', type=intx, default=0,
+                        help='Data and noise seed [default=%(default)r]')
+    parser.add_argument('--output', default='sweep',
+                        help='Output directory [default=%(default)r]')
+    return parser
+
+
+def main(options=None):
+    args = options if options is not None else argument_parser().parse_args()
+    os.makedirs(args.output, exist_ok=True)
+    enable_performance_counters()
+    waveform = WAVEFORMS[args.waveform](differential=args.differential,
+                                        sps=args.sps,
+                                        excessBandwidth=args.excess_bw)
+    results = []
+    for value in args.values:
+        result = run_point(waveform, args.impairment, value, args)
+        rate = result['samples_per_sec']
+        print(f"{args.impairment}={value:g}: "
+              f"{rate if rate is not None else float('nan'):.3g} samples/sec")
+        results.append(result)
+    with open(os.path.join(args.output, 'results.json'), 'w') as resultFile:
+        json.dump({'waveform': args.waveform,
+                   'samp_rate': args.samp_rate,
+                   'results': results}, resultFile, indent=2)
+
+
+if __name__ == '__main__':
+    main()
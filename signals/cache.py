@@ -0,0 +1,177 @@
+from collections import OrderedDict
+import json
+import os
+import tempfile
+import threading
+import numpy as np
+
+
+class LRUCache():
+    """
+    A size-bounded least-recently-used cache
+
+    Every entry is charged a size in bytes, and the least recently used entries
+    are evicted whenever the total exceeds maxBytes. NumPy arrays are stored
+    read-only so that cached samples cannot be modified by their users.
+
+    Parameters
+    ----------
+      - maxBytes: The maximum total size of the cached entries
+    """
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.nBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, factory, nBytes=None):
+        """
+        Return the cached value for key, creating it with factory() on a miss
+
+        Parameters
+        ----------
+          - key: A hashable key identifying the value
+          - factory: A function with no arguments that creates the value
+          - nBytes: A function that returns the size of the value in bytes.
+            By default the size of arrays is their nbytes and other values
+            are charged nothing
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            self.misses += 1
+        value = factory()
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        size = nBytes(value) if nBytes is not None else getattr(value, 'nbytes', 0)
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key][0]
+            if size <= self.maxBytes:
+                self._entries[key] = (value, size)
+                self.nBytes += size
+                while self.nBytes > self.maxBytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.nBytes -= evicted
+                    self.evictions += 1
+        return value
+
+    def clear(self):
+        """
+        Remove every entry and reset the statistics
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nBytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """
+        Return the hit/miss statistics and memory use of the cache
+        """
+        with self._lock:
+            nLookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_rate': self.hits / nLookups if nLookups else 0.0,
+                    'entries': len(self._entries),
+                    'bytes': self.nBytes,
+                    'max_bytes': self.maxBytes}
+
+
+class ShardCache():
+    """
+    A directory of synthesized dataset shards, addressed by the hash of
+    everything that determines their content
+
+    Each shard is stored as <key>.npy holding its complex64 vectors and
+    <key>.json holding its annotation metadata. Files are written to a
+    temporary name and renamed into place, so an interrupted run never leaves
+    a partial shard behind and several runs can share a directory.
+
+    Parameters
+    ----------
+      - directory: The cache directory. It is created if it does not exist
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.npy', base + '.json'
+
+    def __contains__(self, key):
+        return all(os.path.exists(path) for path in self._paths(key))
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.directory)
+                   if name.endswith('.json'))
+
+    def get(self, key, mmap=True):
+        """
+        Load a cached shard
+
+        Parameters
+        ----------
+          - key: The shard key
+          - mmap: If true, the vectors are memory mapped rather than read
+
+        Returns
+        -------
+          - data: The (nVecs, nSamps) complex64 vectors of the shard
+          - metadata: The annotation metadata of the shard
+        """
+        dataPath, metaPath = self._paths(key)
+        with open(metaPath) as metaFile:
+            metadata = json.load(metaFile)
+        data = np.load(dataPath, mmap_mode='r' if mmap else None)
+        return data, metadata
+
+    def put(self, key, data, metadata):
+        """
+        Store a shard
+
+        Parameters
+        ----------
+          - key: The shard key
+          - data: The (nVecs, nSamps) complex64 vectors of the shard
+          - metadata: The JSON-serializable annotation metadata of the shard
+        """
+        dataPath, metaPath = self._paths(key)
+        # The metadata is renamed into place last, so a shard only counts as
+        # cached once both files are complete
+        for path, write in ((dataPath, lambda f: np.save(f, data)),
+                            (metaPath, lambda f: f.write(
+                                json.dumps(metadata).encode()))):
+            fd, tmpPath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as tmpFile:
+                    write(tmpFile)
+                os.replace(tmpPath, path)
+            except BaseException:
+                os.remove(tmpPath)
+                raise
+
+
+# Process-wide caches of radar waveform samples and transmitter blocks. Each
+# has its own budget: the transmitter cache is only charged for the memory of
+# the blocks themselves, not for the samples they share with the sample cache
+sampleCache = LRUCache(256*2**20)
+transmitterCache = LRUCache(256*2**20)
@@ -1,4 +1,26 @@
+import numpy as np
 from gnuradio import gr, blocks, analog, channels
+from signals.precision import as_complex, phasor
+from signals.profiling import profiler
+
+
+# Taps of the interpolator channels.dynamic_channel_model uses to apply the
+# sample rate offset
+SRO_INTERPOLATOR_TAPS = 8
+
+
+def settling_samples(nTapsMultipath, sampleRateOffset=True):
+    """
+    Return the number of samples the filters of a channel need to settle
+    before its output is valid
+
+    Parameters
+    ----------
+      - nTapsMultipath: Length of the multipath filter of the channel
+      - sampleRateOffset: If true, the channel also applies a sample rate
+        offset with an interpolator, as channels.dynamic_channel_model does
+    """
+    return nTapsMultipath + (SRO_INTERPOLATOR_TAPS if sampleRateOffset else 0)
 
 
 class Channel(gr.hier_block2):
@@ -7,16 +29,234 @@ class Channel(gr.hier_block2):
         gr.hier_block2.__init__(self, name,
                                 gr.io_signature(1, 1, gr.sizeof_gr_complex),
                                 gr.io_signature(1, 1, gr.sizeof_gr_complex))
+        self.nTapsMultipath = nTapsMultipath
+        # Samples the fading filter needs to settle
+        self.transient = settling_samples(nTapsMultipath, sampleRateOffset=False)
         noiseAmplitude = 10**(noisePower/20)
-        adder = blocks.add_cc()
-        noiseSource = analog.noise_source_c(
+        self.adder = blocks.add_cc()
+        self.noiseSource = analog.noise_source_c(
             analog.GR_GAUSSIAN, noiseAmplitude, seed)
-        fading_model = channels.selective_fading_model(
+        self.fading_model = channels.selective_fading_model(
             nSinusoids, doppFreq/sampRate, losModel, kFactor, seed, delays, mags, nTapsMultipath)
-        self.connect(self, fading_model)
-        self.connect(fading_model, (adder, 0))
-        self.connect(noiseSource, (adder, 1))
-        self.connect(adder, self)
+        self.connect(self, self.fading_model)
+        self.connect(self.fading_model, (self.adder, 0))
+        self.connect(self.noiseSource, (self.adder, 1))
+        self.connect(self.adder, self)
+
+    def set_noise_power(self, noisePower):
+        """
+        Change the noise power (dB) without rebuilding the channel
+        """
+        self.noiseSource.set_amplitude(10**(noisePower/20))
+
+    def counted_blocks(self):
+        """
+        Return the (name, block) pairs of the blocks in the channel, for
+        profiler.record_blocks()
+        """
+        return [('channel.fading', self.fading_model),
+                ('channel.noise', self.noiseSource),
+                ('channel.adder', self.adder)]
+
+
+class BatchChannel():
+    """
+    A NumPy channel that applies the impairments of
+    channels.dynamic_channel_model to a whole (N, nSamps) batch of vectors at
+    once. Each row is an independent channel realization with its own seed and
+    noise voltage. The impairments are applied in the same order as the GNU
+    Radio model: sample rate offset, carrier frequency offset, selective
+    fading, and additive white Gaussian noise.
+
+    Parameters
+    ----------
+      - sampRate: The sample rate of the input data (Hz)
+      - sroStdDev: Standard deviation of the sample rate offset random walk
+        step (Hz per sample)
+      - sroMaxDev: Maximum sample rate offset (Hz)
+      - cfoStdDev: Standard deviation of the carrier frequency offset random
+        walk step (Hz per sample)
+      - cfoMaxDev: Maximum carrier frequency offset (Hz)
+      - nSinusoids: Number of sinusoids in each sum-of-sinusoids fader
+      - doppFreq: Maximum Doppler frequency (Hz)
+      - losModel: If true, use a Rician (line of sight) fading model.
+        Otherwise the fading is Rayleigh
+      - kFactor: The Rician K factor
+      - delays: Fractional sample delays of the power delay profile
+      - mags: Magnitudes corresponding to the delays above
+      - nTapsMultipath: Length of the filter that interpolates the power
+        delay profile
+    """
+
+    def __init__(self, sampRate, sroStdDev, sroMaxDev, cfoStdDev, cfoMaxDev,
+                 nSinusoids, doppFreq, losModel, kFactor, delays, mags,
+                 nTapsMultipath):
+        self.sampRate = sampRate
+        self.sroStdDev = sroStdDev
+        self.sroMaxDev = sroMaxDev
+        self.cfoStdDev = cfoStdDev
+        self.cfoMaxDev = cfoMaxDev
+        self.nSinusoids = nSinusoids
+        self.doppFreq = doppFreq
+        self.losModel = losModel
+        self.kFactor = kFactor
+        self.delays = np.asarray(delays, dtype=np.float64)
+        self.mags = np.asarray(mags, dtype=np.float64)
+        self.nTapsMultipath = nTapsMultipath
+        # Fractional-delay interpolation filter for each path, with shape
+        # (nPaths, nTapsMultipath). selective_fading_model interpolates with
+        # sin(x)/x at x = 2*pi*(k - delay)/4, which is np.sinc((k - delay)/2)
+        self.pathTaps = np.sinc((np.arange(nTapsMultipath) -
+                                 self.delays[:, np.newaxis]) / 2)
+
+    def apply(self, data, noiseVoltages, seeds):
+        """
+        Apply the channel to a batch of vectors
+
+        Parameters
+        ----------
+          - data: An (N, nSamps) complex array with one vector per row
+          - noiseVoltages: The noise voltage of each row, or a single voltage
+            used for every row
+          - seeds: One seed per row. If a single integer is given, the per-row
+            seeds are derived from it
+
+        Returns
+        -------
+          - data: An (N, nSamps) complex64 array of impaired vectors
+        """
+        data = as_complex(np.atleast_2d(data))
+        nVecs, nSamps = data.shape
+        noiseVoltages = np.broadcast_to(
+            np.asarray(noiseVoltages, dtype=np.float32), (nVecs,))
+        rngs = self._row_generators(seeds, nVecs)
+        with profiler.stage('channel.sro', nVecs=nVecs):
+            data = self._sample_rate_offset(data, rngs)
+        with profiler.stage('channel.cfo', nVecs=nVecs):
+            data = self._carrier_frequency_offset(data, rngs)
+        with profiler.stage('channel.fading', nVecs=nVecs):
+            data = self._selective_fading(data, rngs)
+        with profiler.stage('channel.awgn', nVecs=nVecs):
+            return self._awgn(data, noiseVoltages, rngs)
+
+    @staticmethod
+    def _row_generators(seeds, nVecs):
+        """
+        Create one random number generator per row
+        """
+        if np.ndim(seeds) == 0:
+            seeds = np.random.SeedSequence(seeds).spawn(nVecs)
+        elif len(seeds) != nVecs:
+            raise ValueError(f'Expected {nVecs} seeds, got {len(seeds)}')
+        return [np.random.default_rng(seed) for seed in seeds]
+
+    @staticmethod
+    def _random_walk(rngs, nSamps, stdDev, maxDev):
+        """
+        Draw an (N, nSamps) Gaussian random walk per row, limited to
+        +/- maxDev. The limit is applied to the accumulated walk rather than
+        at every step, which only differs from the GNU Radio model once the
+        walk reaches its bound.
+        """
+        steps = np.stack([rng.standard_normal(nSamps) for rng in rngs])
+        return np.clip(np.cumsum(stdDev*steps, axis=1), -maxDev, maxDev)
+
+    def _sample_rate_offset(self, data, rngs):
+        """
+        Resample each row at a drifting rate using linear interpolation
+        """
+        nVecs, nSamps = data.shape
+        offset = self._random_walk(rngs, nSamps, self.sroStdDev, self.sroMaxDev)
+        step = 1 + offset/self.sampRate
+        position = np.cumsum(step, axis=1) - step[:, :1]
+        position = np.minimum(position, nSamps-1)
+        iLow = np.minimum(position.astype(np.intp), nSamps-2)
+        frac = (position - iLow).astype(np.float32)
+        low = np.take_along_axis(data, iLow, axis=1)
+        high = np.take_along_axis(data, iLow+1, axis=1)
+        return low + frac*(high - low)
+
+    def _carrier_frequency_offset(self, data, rngs):
+        """
+        Rotate each row by a drifting carrier frequency offset
+        """
+        nVecs, nSamps = data.shape
+        offset = self._random_walk(rngs, nSamps, self.cfoStdDev, self.cfoMaxDev)
+        phase = 2*np.pi*np.cumsum(offset, axis=1)/self.sampRate
+        return data*phasor(phase)
+
+    def _fading_gains(self, rngs, nSamps):
+        """
+        Generate the sum-of-sinusoids fading gain of every path, with shape
+        (N, nPaths, nSamps)
+        """
+        nPaths = len(self.delays)
+        N = self.nSinusoids
+        # Per row: one (theta, psi, phi) set per path, plus the LOS phases
+        params = np.stack([rng.uniform(-np.pi, np.pi, (nPaths, 2*N+3))
+                           for rng in rngs])
+        theta = params[:, :, 0]
+        psi = params[:, :, 1:N+1]
+        phi = params[:, :, N+1:2*N+1]
+        n = np.arange(1, N+1)
+        alpha = (2*np.pi*n - np.pi + theta[..., np.newaxis]) / (4*N)
+        wd = 2*np.pi*self.doppFreq/self.sampRate
+        t = np.arange(nSamps, dtype=np.float32)
+        # Accumulate in float32, where np.cos is vectorized much more
+        # efficiently than in float64
+        alpha, psi, phi = (x.astype(np.float32) for x in (alpha, psi, phi))
+        shape = (len(rngs), nPaths, nSamps)
+        real = np.zeros(shape, dtype=np.float32)
+        imag = np.zeros(shape, dtype=np.float32)
+        arg = np.empty(shape, dtype=np.float32)
+        for iSin in range(N):
+            for total, freq, phase in ((real, np.cos(alpha), psi),
+                                       (imag, np.sin(alpha), phi)):
+                np.multiply(wd*freq[..., iSin, np.newaxis], t, out=arg)
+                arg += phase[..., iSin, np.newaxis]
+                total += np.cos(arg, out=arg)
+        gains = np.empty(shape, dtype=np.complex64)
+        gains.real = real
+        gains.imag = imag
+        gains *= np.float32(np.sqrt(1/N))
+        if self.losModel:
+            thetaLos = params[:, :, 2*N+1, np.newaxis].astype(np.float32)
+            psiLos = params[:, :, 2*N+2, np.newaxis].astype(np.float32)
+            np.multiply(wd*np.cos(thetaLos), t, out=arg)
+            arg += psiLos
+            gains *= np.float32(1/np.sqrt(self.kFactor+1))
+            scaleLos = np.float32(np.sqrt(self.kFactor/(self.kFactor+1)))
+            gains.real += scaleLos*np.cos(arg)
+            gains.imag += scaleLos*np.sin(arg)
+        return gains
+
+    def _selective_fading(self, data, rngs):
+        """
+        Filter each row with a time-varying multipath filter whose taps are
+        the faded paths interpolated onto the sample grid
+        """
+        nVecs, nSamps = data.shape
+        gains = self._fading_gains(rngs, nSamps)
+        weights = (self.mags[:, np.newaxis]*self.pathTaps).astype(np.float32)
+        output = np.zeros_like(data)
+        tap = np.empty_like(data)
+        for iTap in range(self.nTapsMultipath):
+            # (N, nSamps) gain of this tap at every sample
+            np.multiply(weights[0, iTap], gains[:, 0], out=tap)
+            for iPath in range(1, len(self.delays)):
+                tap += weights[iPath, iTap]*gains[:, iPath]
+            output[:, iTap:] += tap[:, iTap:]*data[:, :nSamps-iTap]
+        return output
+
+    @staticmethod
+    def _awgn(data, noiseVoltages, rngs):
+        """
+        Add complex white Gaussian noise with total power noiseVoltage**2
+        """
+        nVecs, nSamps = data.shape
+        noise = np.stack([rng.standard_normal(2*nSamps, dtype=np.float32)
+                          for rng in rngs]).view(np.complex64)
+        return data + (noiseVoltages/np.sqrt(2, dtype=np.float32))[:, np.newaxis]*noise
 
 
 if __name__ == '__main__':
@@ -0,0 +1,180 @@
+import numpy as np
+import pmt
+from gnuradio import gr
+from signals.precision import COMPLEX_DTYPE
+
+# Key of the stream tags and name of the message port of StreamClassifier
+CLASSIFICATION_KEY = 'classification'
+
+
+def window_starts(nRead, nOutput, nSamps, hop):
+    """
+    Return the absolute start of every window that is completed by a chunk
+    of a stream
+
+    Windows start every hop samples from the start of the stream, and a
+    window is completed by the chunk that holds its last sample.
+
+    Parameters
+    ----------
+      - nRead: The absolute index of the first sample of the chunk
+      - nOutput: The number of samples in the chunk
+      - nSamps: The number of samples per window
+      - hop: The number of samples between window starts
+
+    Returns
+    -------
+      - starts: An int64 array of window starts, in increasing order
+    """
+    first = max(nRead - nSamps + 1, 0)
+    last = nRead + nOutput - nSamps
+    first = -(-first // hop) * hop
+    return np.arange(first, last + 1, hop, dtype=np.int64)
+
+
+class StreamClassifier(gr.sync_block):
+    """
+    Classify a continuous complex stream in overlapping windows
+
+    The block passes its input through unchanged, so it can be placed
+    anywhere in a flowgraph, e.g. after a Channel or a file source. Every hop
+    samples a window of the classifier's input length is cut from the stream.
+    The block keeps nSamps-1 samples of history, so the windows are
+    zero-copy strided views of the scheduler buffer, including windows that
+    straddle two calls of work(). Windows are gathered into batches of
+    batchSize and classified with one model call per batch.
+
+    A message is published on the 'classification' port for each batch,
+    with the classes and the class ids, confidences and window starts of the
+    batch as vectors. A stream tag with key 'classification' marks every
+    window where the predicted class changes. It is added to the output at
+    the window's last sample, or at the first sample of the current output
+    if the window was classified later, and its value is a dictionary with
+    the label, class id, confidence and window start. Reporting changes
+    rather than every window keeps the per-window Python work to slicing, so
+    the block can keep up with 20 MS/s streams if the model can. The model
+    runs on nSamps/hop windows per nSamps samples, so raise hop if it can
+    not.
+
+    Parameters
+    ----------
+      - classifier: The signals.inference.Classifier to run
+      - hop: The number of samples between window starts. Defaults to half
+        a window
+      - batchSize: The number of windows per model call. Larger batches
+        give higher throughput and later results
+      - tags: If false, only messages are emitted
+      - name: The name of the block
+    """
+
+    def __init__(self, classifier, hop=None, batchSize=256, tags=True,
+                 name='StreamClassifier'):
+        gr.sync_block.__init__(self, name=name,
+                               in_sig=[np.complex64],
+                               out_sig=[np.complex64])
+        self.classifier = classifier
+        self.nSamps = classifier.nSamps
+        self.hop = hop or max(self.nSamps // 2, 1)
+        self.batchSize = batchSize
+        self.tags = tags
+        self.set_history(self.nSamps)
+        self.classes = list(classifier.classes)
+        self.labelKeys = [pmt.intern(label) for label in self.classes]
+        self.key = pmt.intern(CLASSIFICATION_KEY)
+        self.message_port_register_out(self.key)
+        # Windows waiting for a full batch, copied out of the scheduler buffer
+        self.pending = np.empty((batchSize, self.nSamps), dtype=COMPLEX_DTYPE)
+        self.pendingStarts = np.empty((batchSize,), dtype=np.int64)
+        self.nPending = 0
+        self.lastLabelId = -1
+
+    def work(self, input_items, output_items):
+        samples = input_items[0]
+        nOutput = len(output_items[0])
+        # The input starts with the nSamps-1 samples of history
+        output_items[0][:] = samples[self.nSamps-1:]
+        nRead = self.nitems_read(0)
+        starts = window_starts(nRead, nOutput, self.nSamps, self.hop)
+        if len(starts) == 0:
+            return nOutput
+        offset = starts[0] - (nRead - self.nSamps + 1)
+        windows = np.lib.stride_tricks.sliding_window_view(
+            samples, self.nSamps)[offset::self.hop][:len(starts)]
+        iWindow = 0
+        while iWindow < len(starts):
+            if self.nPending == 0 and len(starts) - iWindow >= self.batchSize:
+                # Classify a full batch straight from the scheduler buffer
+                stop = iWindow + self.batchSize
+                self._classify(windows[iWindow:stop], starts[iWindow:stop],
+                               nRead)
+            else:
+                stop = min(iWindow + self.batchSize - self.nPending,
+                           len(starts))
+                nCopy = stop - iWindow
+                self.pending[self.nPending:self.nPending+nCopy] = \
+                    windows[iWindow:stop]
+                self.pendingStarts[self.nPending:self.nPending+nCopy] = \
+                    starts[iWindow:stop]
+                self.nPending += nCopy
+                if self.nPending == self.batchSize:
+                    self._classify(self.pending, self.pendingStarts, nRead)
+                    self.nPending = 0
+            iWindow = stop
+        return nOutput
+
+    def _classify(self, windows, starts, nRead):
+        """
+        Classify a batch of windows and report the results
+
+        Parameters
+        ----------
+          - windows: An (N, nSamps) array of windows
+          - starts: The absolute start of each window
+          - nRead: The absolute index of the first output sample of the
+            current call of work(), or None when the stream has ended
+        """
+        probabilities = self.classifier.predict(windows)
+        labelIds = np.argmax(probabilities, axis=1)
+        confidences = probabilities[np.arange(len(labelIds)), labelIds]
+        if self.tags and nRead is not None:
+            # Tag the windows where the predicted class changes
+            changed = np.flatnonzero(
+                np.diff(labelIds, prepend=self.lastLabelId) != 0)
+            for i in changed:
+                value = pmt.make_dict()
+                value = pmt.dict_add(value, pmt.intern('label'),
+                                     self.labelKeys[labelIds[i]])
+                value = pmt.dict_add(value, pmt.intern('class_id'),
+                                     pmt.from_long(int(labelIds[i])))
+                value = pmt.dict_add(value, pmt.intern('confidence'),
+                                     pmt.from_double(float(confidences[i])))
+                value = pmt.dict_add(value, pmt.intern('start'),
+                                     pmt.from_uint64(int(starts[i])))
+                self.add_item_tag(
+                    0, max(int(starts[i]) + self.nSamps - 1, nRead),
+                    self.key, value)
+        self.lastLabelId = labelIds[-1]
+        message = pmt.make_dict()
+        message = pmt.dict_add(message, pmt.intern('classes'),
+                               pmt.to_pmt(self.classes))
+        message = pmt.dict_add(message, pmt.intern('class_ids'),
+                               pmt.init_s32vector(len(labelIds),
+                                                  labelIds.astype(np.int32).tolist()))
+        message = pmt.dict_add(message, pmt.intern('confidences'),
+                               pmt.init_f32vector(len(confidences),
+                                                  confidences.tolist()))
+        message = pmt.dict_add(message, pmt.intern('starts'),
+                               pmt.init_u64vector(len(starts),
+                                                  [int(s) for s in starts]))
+        self.message_port_pub(self.key, message)
+
+    def stop(self):
+        """
+        Classify the windows left in the last partial batch. They are only
+        reported as a message, since no more samples can be tagged
+        """
+        if self.nPending:
+            self._classify(self.pending[:self.nPending],
+                           self.pendingStarts[:self.nPending], None)
+            self.nPending = 0
+        return True
@@ -0,0 +1,182 @@
+import threading
+from gnuradio import gr, blocks, digital, filter
+from signals.modulator import NumpyModulator, root_raised_cosine
+
+
+class Modulator(gr.hier_block2):
+    """
+    The block chain of digital.generic_mod, built from precomputed
+    root-raised cosine taps
+
+    digital.generic_mod designs a new pulse shaping filter every time it is
+    created. This chain has the same blocks, connected the same way, but
+    takes its taps from the registry, so building a modulator only creates
+    the blocks. For the same taps its output matches digital.generic_mod.
+
+    Parameters
+    ----------
+      - waveform: The CommunicationsWaveform to modulate
+      - taps: The prototype root-raised cosine taps of the polyphase
+        resampler
+    """
+
+    def __init__(self, waveform, taps, name='Modulator'):
+        gr.hier_block2.__init__(self, name,
+                                gr.io_signature(1, 1, gr.sizeof_char),
+                                gr.io_signature(1, 1, gr.sizeof_gr_complex))
+        constellation = waveform.constellation
+        chain = [self]
+        # Turn bytes into k-bit symbol indices
+        self.bytes2chunks = blocks.packed_to_unpacked_bb(
+            constellation.bits_per_symbol(), gr.GR_MSB_FIRST)
+        chain.append(self.bytes2chunks)
+        if constellation.apply_pre_diff_code():
+            self.symbol_mapper = digital.map_bb(constellation.pre_diff_code())
+            chain.append(self.symbol_mapper)
+        if waveform.differential:
+            self.diffenc = digital.diff_encoder_bb(
+                2**constellation.bits_per_symbol())
+            chain.append(self.diffenc)
+        self.chunks2symbols = digital.chunks_to_symbols_bc(
+            constellation.points())
+        self.rrc_filter = filter.pfb_arb_resampler_ccf(
+            waveform.sampsPerSym, [float(tap) for tap in taps])
+        chain += [self.chunks2symbols, self.rrc_filter, self]
+        self.connect(*chain)
+
+
+class ConstellationRegistry():
+    """
+    A process-wide registry of digital constellations and the modulators
+    built from them
+
+    Constellations are defined by a factory registered under a (modulation,
+    order) pair, such as ('psk', 8). Modulations without a factory for the
+    requested order fall back to a generic builder, so any PSK or QAM order
+    GNU Radio supports can be used without registering it first. Each
+    constellation, set of root-raised cosine taps and modulator is built once
+    and reused for every waveform with the same parameters.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._generic = {}
+        self._constellations = {}
+        self._taps = {}
+        self._numpyModulators = {}
+        self._modulators = {}
+        self._lock = threading.RLock()
+
+    def register(self, modulation, order, factory):
+        """
+        Define the constellation of a (modulation, order) pair
+
+        Parameters
+        ----------
+          - modulation: The modulation class, e.g. 'psk' or 'qam'
+          - order: The number of points in the constellation
+          - factory: A function with no arguments that returns a GNU Radio
+            constellation object
+        """
+        with self._lock:
+            self._factories[(modulation, order)] = factory
+            self._constellations.pop((modulation, order), None)
+
+    def register_generic(self, modulation, factory):
+        """
+        Define the constellation of every order of a modulation that has no
+        factory of its own
+
+        Parameters
+        ----------
+          - modulation: The modulation class, e.g. 'psk' or 'qam'
+          - factory: A function taking the order that returns a GNU Radio
+            constellation object
+        """
+        with self._lock:
+            self._generic[modulation] = factory
+
+    def constellation(self, modulation, order):
+        """
+        Return the shared constellation object of a (modulation, order) pair
+        """
+        key = (modulation, order)
+        with self._lock:
+            if key not in self._constellations:
+                if key in self._factories:
+                    self._constellations[key] = self._factories[key]()
+                elif modulation in self._generic:
+                    self._constellations[key] = self._generic[modulation](order)
+                else:
+                    raise KeyError(f'No {order}-{modulation} constellation')
+            return self._constellations[key]
+
+    @staticmethod
+    def _key(waveform):
+        """
+        The (constellation, differential, sps, excessBandwidth) key of a
+        waveform
+        """
+        return ((waveform.detail.modulation, waveform.detail.order),
+                waveform.differential, waveform.sampsPerSym,
+                waveform.excessBandwidth)
+
+    def rrc_taps(self, sampsPerSym, excessBandwidth, nFilts=32):
+        """
+        Return the root-raised cosine taps digital.generic_mod designs for the
+        given parameters
+        """
+        key = (sampsPerSym, excessBandwidth, nFilts)
+        with self._lock:
+            if key not in self._taps:
+                taps = root_raised_cosine(nFilts, nFilts, 1.0, excessBandwidth,
+                                          nFilts*11*int(sampsPerSym))
+                taps.flags.writeable = False
+                self._taps[key] = taps
+            return self._taps[key]
+
+    def numpy_modulator(self, waveform):
+        """
+        Return the shared NumpyModulator for a communications waveform
+        """
+        key = self._key(waveform)
+        with self._lock:
+            if key not in self._numpyModulators:
+                self._numpyModulators[key] = NumpyModulator.from_waveform(
+                    waveform,
+                    taps=self.rrc_taps(waveform.sampsPerSym,
+                                       waveform.excessBandwidth))
+            return self._numpyModulators[key]
+
+    def modulator(self, waveform, shared=True):
+        """
+        Return a Modulator block for a communications waveform, built from
+        the cached root-raised cosine taps
+
+        Parameters
+        ----------
+          - waveform: The CommunicationsWaveform to modulate
+          - shared: If true, return the modulator shared by every waveform with
+            the same parameters. A GNU Radio block can only be part of one
+            flowgraph at a time, so use shared=False for transmitters that run
+            concurrently. Unshared modulators still reuse the cached taps
+        """
+        key = self._key(waveform)
+        with self._lock:
+            if shared and key in self._modulators:
+                return self._modulators[key]
+            modulator = Modulator(
+                waveform, self.rrc_taps(waveform.sampsPerSym,
+                                        waveform.excessBandwidth))
+            if shared:
+                self._modulators[key] = modulator
+            return modulator
+
+
+registry = ConstellationRegistry()
+registry.register('psk', 2, digital.constellation_bpsk)
+registry.register('psk', 4, digital.constellation_qpsk)
+registry.register('psk', 8, digital.constellation_8psk)
+registry.register('qam', 16, digital.constellation_16qam)
+registry.register_generic('psk', lambda order: digital.psk_constellation(order))
+registry.register_generic('qam', lambda order: digital.qam_constellation(order))
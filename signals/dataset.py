@@ -0,0 +1,166 @@
+import json
+import os
+import numpy as np
+from sigmf import SigMFFile
+from signals.index import DatasetIndex, DatasetSplit, INDEX_EXTENSION, \
+    SPLIT_EXTENSION
+from signals.precision import COMPLEX_DTYPE, REAL_DTYPE
+
+
+def to_iq(samples):
+    """
+    Convert complex vectors to the float32 I/Q tensor layout used for
+    training
+
+    Parameters
+    ----------
+      - samples: An (..., nSamps) complex64 array
+
+    Returns
+    -------
+      - iq: An (..., 2, nSamps) float32 array. Row 0 of each vector holds the
+        real part and row 1 the imaginary part
+    """
+    samples = np.ascontiguousarray(samples, dtype=COMPLEX_DTYPE)
+    # Interleaved I/Q as (..., nSamps, 2), then moved to (..., 2, nSamps)
+    iq = samples.view(REAL_DTYPE).reshape(samples.shape + (2,))
+    return np.ascontiguousarray(np.moveaxis(iq, -1, -2))
+
+
+class SigMFDataset():
+    """
+    A zero-copy view of a SigMF recording of fixed-length vectors
+
+    The .sigmf-data file is memory mapped and the vectors are exposed as an
+    (nVecs, nSamps) strided view of the mapping, so opening a dataset does not
+    read any samples. Labels and noise voltages come from the columnar
+    DatasetIndex next to the recording, or from the JSON annotations if the
+    recording has no index. Samples are converted to float32 I/Q tensors one
+    batch at a time with batch().
+
+    Parameters
+    ----------
+      - filename: Path of the recording, without the SigMF extension
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename + '.sigmf-meta') as metaFile:
+            self.meta = json.load(metaFile)
+        datatype = self.meta['global'][SigMFFile.DATATYPE_KEY]
+        if datatype != 'cf32_le':
+            raise ValueError(f'Unsupported datatype {datatype}')
+        if os.path.exists(filename + INDEX_EXTENSION):
+            self.index = DatasetIndex.load(filename)
+        else:
+            self.index = DatasetIndex()
+            for annotation in self.meta['annotations']:
+                self.index.append_annotation(annotation)
+        dataFilename = filename + '.sigmf-data'
+        if os.path.getsize(dataFilename) == 0:
+            # np.memmap can not map an empty file, e.g. a recording that was
+            # closed before any vector was appended
+            self.data = np.zeros((0,), dtype='<c8')
+        else:
+            self.data = np.memmap(dataFilename, dtype='<c8', mode='r')
+        self.vectors = self._vector_view()
+
+    def _vector_view(self):
+        """
+        Return an (nVecs, nSamps) view of the memory mapped samples. The
+        vectors must have the same length and be evenly spaced in the file
+        """
+        start = self.index.start
+        length = self.index.length
+        if len(start) == 0:
+            return self.data[:0].reshape(0, 0)
+        nSamps = int(length[0])
+        if np.any(length != nSamps):
+            raise ValueError('All vectors must have the same length')
+        stride = int(start[1] - start[0]) if len(start) > 1 else nSamps
+        if np.any(np.diff(start) != stride):
+            raise ValueError('Vectors must be evenly spaced in the recording')
+        itemsize = self.data.itemsize
+        return np.lib.stride_tricks.as_strided(
+            self.data[start[0]:], shape=(len(start), nSamps),
+            strides=(stride*itemsize, itemsize), writeable=False)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def nSamps(self):
+        """
+        The number of samples per vector
+        """
+        return self.vectors.shape[1]
+
+    @property
+    def classes(self):
+        """
+        The sorted distinct labels in the dataset
+        """
+        return np.unique(self.index.labels)
+
+    @property
+    def labels(self):
+        """
+        The label string of every vector
+        """
+        return self.index.label_names()
+
+    @property
+    def labelIds(self):
+        """
+        The position of every vector's label in classes
+        """
+        return np.searchsorted(self.classes, self.labels)
+
+    @property
+    def noiseVoltages(self):
+        """
+        The noise voltage (dB) of every vector
+        """
+        return self.index.noiseVoltage
+
+    def batch(self, indices):
+        """
+        Return the selected vectors as a float32 tensor with shape
+        (nIndices, 2, nSamps). Row 0 of each vector holds the real part and
+        row 1 the imaginary part
+
+        Parameters
+        ----------
+          - indices: Indices (or a slice) of the vectors to load
+        """
+        return to_iq(self.vectors[indices])
+
+    def split(self, fractions=None, seed=0):
+        """
+        Return a stratified split of the vectors by label and noise voltage
+
+        The split is saved next to the recording the first time it is drawn.
+        Later calls with the same fractions and seed load it instead, so every
+        run trains and tests on the same vectors.
+
+        Parameters
+        ----------
+          - fractions: Dictionary mapping each partition name to its fraction
+            of the vectors. Defaults to an even train/test split
+          - seed: The seed of the random assignment
+
+        Returns
+        -------
+          - split: A DatasetSplit with sorted int32 indices for each partition
+        """
+        if fractions is None:
+            fractions = {'train': 0.5, 'test': 0.5}
+        if os.path.exists(self.filename + SPLIT_EXTENSION):
+            split = DatasetSplit.load(self.filename)
+            if split.fractions == dict(fractions) and split.seed == seed \
+                    and split.nVecs == len(self):
+                return split
+        split = DatasetSplit.stratified(self.labelIds, self.noiseVoltages,
+                                        fractions, seed)
+        split.save(self.filename)
+        return split
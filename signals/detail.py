@@ -37,13 +37,12 @@ class detail():
 
     def dict(self):
         """
-        Convert the supplied metadata to a dictionary of dictionaries
+        Convert the supplied metadata to a dictionary of dictionaries. The
+        dictionary is a copy, so the metadata object is left unchanged
         """
-        d = vars(self)
-        # If any of the values are None, remove them from the dictionary
-        for key,value in d.copy().items():
-            if value is None:
-                del d[key]
+        # Leave out the values that are None
+        d = {key: value for key, value in vars(self).items()
+             if value is not None}
         
         # Had to make 'modulation' the class variable storing the signal class
         # (analog/digital) because class is a keyword in python
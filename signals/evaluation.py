@@ -0,0 +1,222 @@
+import json
+import numpy as np
+
+
+def predict(model, x, batchSize=1024):
+    """
+    Run a single batched prediction over a whole test set
+
+    Parameters
+    ----------
+      - model: A trained Keras model
+      - x: The (N, 2, nSamps) float32 test tensor, or a tf.data.Dataset of
+        batches in test set order
+      - batchSize: Number of examples per prediction batch
+
+    Returns
+    -------
+      - scores: An (N, nClasses) float32 array of class scores
+    """
+    if isinstance(x, np.ndarray):
+        return np.asarray(model.predict(x, batch_size=batchSize, verbose=0),
+                          dtype=np.float32)
+    return np.asarray(model.predict(x, verbose=0), dtype=np.float32)
+
+
+def confusion_matrices(trueIds, predictedIds, nClasses, groupIds=None,
+                       nGroups=1):
+    """
+    Count confusion matrices for every group of examples at once
+
+    Parameters
+    ----------
+      - trueIds: The true class index of each example
+      - predictedIds: The predicted class index of each example
+      - nClasses: The number of classes
+      - groupIds: The group (e.g. noise voltage) index of each example. If
+        None, every example is in group 0
+      - nGroups: The number of groups
+
+    Returns
+    -------
+      - confusion: An (nGroups, nClasses, nClasses) int64 array, where
+        confusion[g, i, j] counts the examples of group g with true class i
+        predicted as class j
+    """
+    trueIds = np.asarray(trueIds, dtype=np.int64)
+    predictedIds = np.asarray(predictedIds, dtype=np.int64)
+    flat = trueIds*nClasses + predictedIds
+    if groupIds is not None:
+        flat += np.asarray(groupIds, dtype=np.int64)*nClasses*nClasses
+    counts = np.bincount(flat, minlength=nGroups*nClasses*nClasses)
+    return counts.reshape(nGroups, nClasses, nClasses)
+
+
+def normalize_rows(confusion):
+    """
+    Normalize confusion matrices so each row (true class) sums to 1. Rows
+    without examples are left at 0
+    """
+    confusion = np.asarray(confusion, dtype=np.float64)
+    totals = confusion.sum(axis=-1, keepdims=True)
+    return np.divide(confusion, totals, out=np.zeros_like(confusion),
+                     where=totals > 0)
+
+
+def true_class_ranks(scores, trueIds):
+    """
+    Return the rank of the true class in the scores of each example, where
+    rank 0 is the highest score. Ties are counted in favor of the true class
+    """
+    trueScores = scores[np.arange(len(scores)), trueIds]
+    return np.count_nonzero(scores > trueScores[:, np.newaxis], axis=1)
+
+
+def _group_mean(values, groupIds, nGroups):
+    """
+    Return the mean of values over each group, or NaN for empty groups
+    """
+    totals = np.bincount(groupIds, weights=values, minlength=nGroups)
+    counts = np.bincount(groupIds, minlength=nGroups)
+    return np.divide(totals, counts, out=np.full((nGroups,), np.nan),
+                     where=counts > 0)
+
+
+class Evaluation():
+    """
+    Classification metrics of a test set, computed from a single set of
+    predictions
+
+    Every metric is computed for the whole test set and for each noise
+    voltage, using bincount reductions over all examples at once.
+
+    Parameters
+    ----------
+      - scores: The (N, nClasses) class scores of the test examples
+      - labelIds: The true class index of each example
+      - noiseVoltages: The noise voltage (dB) of each example
+      - classes: The class names, in class index order
+      - topK: The k values of the top-k accuracies
+
+    Attributes
+    ----------
+      - voltages: The sorted unique noise voltages
+      - confusion: (nClasses, nClasses) confusion counts of the test set
+      - confusionBySnr: (nVoltages, nClasses, nClasses) confusion counts
+      - accuracy: The overall accuracy
+      - accuracyBySnr: The accuracy at each noise voltage
+      - classAccuracy: The accuracy of each class
+      - classAccuracyBySnr: (nVoltages, nClasses) accuracy of each class at
+        each noise voltage
+      - topKAccuracy: Dictionary mapping k to the overall top-k accuracy
+      - topKAccuracyBySnr: Dictionary mapping k to the top-k accuracy at
+        each noise voltage
+    """
+
+    def __init__(self, scores, labelIds, noiseVoltages, classes, topK=(1, 2, 3)):
+        scores = np.asarray(scores)
+        self.classes = list(classes)
+        nClasses = len(self.classes)
+        self.labelIds = np.asarray(labelIds, dtype=np.int64)
+        self.predictedIds = np.argmax(scores, axis=1)
+        self.voltages, self.voltageIds = np.unique(
+            np.asarray(noiseVoltages, dtype=np.float64), return_inverse=True)
+        self.voltageIds = self.voltageIds.ravel()
+        nVoltages = len(self.voltages)
+        self.confusionBySnr = confusion_matrices(
+            self.labelIds, self.predictedIds, nClasses, self.voltageIds,
+            nVoltages)
+        self.confusion = self.confusionBySnr.sum(axis=0)
+        correct = np.trace(self.confusionBySnr, axis1=1, axis2=2)
+        nExamples = self.confusionBySnr.sum(axis=(1, 2))
+        self.accuracy = float(correct.sum() / max(nExamples.sum(), 1))
+        self.accuracyBySnr = np.divide(
+            correct, nExamples, out=np.full((nVoltages,), np.nan),
+            where=nExamples > 0)
+        self.classAccuracy = np.diagonal(normalize_rows(self.confusion)).copy()
+        self.classAccuracyBySnr = np.diagonal(
+            normalize_rows(self.confusionBySnr), axis1=1, axis2=2).copy()
+        ranks = true_class_ranks(scores, self.labelIds)
+        self.topKAccuracy = {}
+        self.topKAccuracyBySnr = {}
+        for k in topK:
+            hits = (ranks < k).astype(np.float64)
+            self.topKAccuracy[k] = float(hits.mean()) if len(hits) else np.nan
+            self.topKAccuracyBySnr[k] = _group_mean(hits, self.voltageIds,
+                                                    nVoltages)
+
+    @classmethod
+    def from_model(cls, model, x, labelIds, noiseVoltages, classes,
+                   batchSize=1024, topK=(1, 2, 3)):
+        """
+        Predict the test set with a single batched call and evaluate it
+
+        Parameters
+        ----------
+          - model: A trained Keras model
+          - x: The test inputs, as accepted by predict()
+          - labelIds: The true class index of each example
+          - noiseVoltages: The noise voltage (dB) of each example
+          - classes: The class names, in class index order
+          - batchSize: Number of examples per prediction batch
+          - topK: The k values of the top-k accuracies
+        """
+        return cls(predict(model, x, batchSize), labelIds, noiseVoltages,
+                   classes, topK)
+
+    def normalized(self, confusion=None):
+        """
+        Return row-normalized confusion matrices. By default, the confusion
+        matrix of the whole test set
+        """
+        return normalize_rows(self.confusion if confusion is None else confusion)
+
+    def to_dict(self):
+        """
+        Return every metric as a JSON-serializable dictionary. Noise voltages
+        of -inf dB (no noise) are stored as null
+        """
+        def voltage(value):
+            return float(value) if np.isfinite(value) else None
+
+        def values(array):
+            return [None if np.isnan(value) else float(value)
+                    for value in np.ravel(array)]
+        return {
+            'classes': self.classes,
+            'noise_voltages': [voltage(value) for value in self.voltages],
+            'accuracy': self.accuracy,
+            'accuracy_by_snr': values(self.accuracyBySnr),
+            'class_accuracy': values(self.classAccuracy),
+            'class_accuracy_by_snr': [values(row) for row in self.classAccuracyBySnr],
+            'top_k_accuracy': {str(k): value
+                               for k, value in self.topKAccuracy.items()},
+            'top_k_accuracy_by_snr': {str(k): values(value)
+                                      for k, value in self.topKAccuracyBySnr.items()},
+            'confusion': self.confusion.tolist(),
+            'confusion_by_snr': self.confusionBySnr.tolist(),
+        }
+
+    def save_json(self, filename):
+        """
+        Write every metric to a JSON file
+        """
+        with open(filename, 'w') as jsonFile:
+            json.dump(self.to_dict(), jsonFile, indent=2)
+
+    def save_npz(self, filename):
+        """
+        Write every metric to a NumPy .npz archive
+        """
+        arrays = {'classes': np.array(self.classes),
+                  'noise_voltages': self.voltages,
+                  'confusion': self.confusion,
+                  'confusion_by_snr': self.confusionBySnr,
+                  'accuracy': np.array(self.accuracy),
+                  'accuracy_by_snr': self.accuracyBySnr,
+                  'class_accuracy': self.classAccuracy,
+                  'class_accuracy_by_snr': self.classAccuracyBySnr}
+        for k in self.topKAccuracy:
+            arrays[f'top_{k}_accuracy'] = np.array(self.topKAccuracy[k])
+            arrays[f'top_{k}_accuracy_by_snr'] = self.topKAccuracyBySnr[k]
+        np.savez(filename, **arrays)
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from signals.index import INDEX_EXTENSION
+from signals.precision import REAL_DTYPE
+from signals.profiling import profiler
+
+FEATURE_EXTENSION = '.sigmf-features'
+# Cumulants returned by cumulants(), in column order
+CUMULANTS = ('C20', 'C40', 'C41', 'C42', 'C60', 'C63')
+
+
+def spectrogram(samples, nFft=16, hop=None):
+    """
+    Compute the log power spectrogram of every vector
+
+    Parameters
+    ----------
+      - samples: An (N, nSamps) complex array
+      - nFft: The number of samples (and frequency bins) per frame
+      - hop: The number of samples between frames. Defaults to nFft/2
+
+    Returns
+    -------
+      - spectrogram: An (N, nFrames, nFft) float32 array of power (dB), with
+        the zero frequency bin in the middle of each frame
+    """
+    hop = hop or nFft // 2
+    window = np.hanning(nFft).astype(REAL_DTYPE)
+    frames = np.lib.stride_tricks.sliding_window_view(
+        samples, nFft, axis=-1)[..., ::hop, :]
+    spectrum = np.fft.fftshift(np.fft.fft(frames*window, axis=-1), axes=-1)
+    power = spectrum.real**2 + spectrum.imag**2
+    return (10*np.log10(power + 1e-12)).astype(REAL_DTYPE)
+
+
+def instantaneous(samples):
+    """
+    Compute the instantaneous amplitude, phase and frequency of every vector
+
+    Parameters
+    ----------
+      - samples: An (N, nSamps) complex array
+
+    Returns
+    -------
+      - features: An (N, 3, nSamps) float32 array. Row 0 of each vector holds
+        the amplitude, row 1 the unwrapped phase (radians) and row 2 the
+        frequency (cycles/sample). The first frequency of each vector is 0
+    """
+    features = np.empty(samples.shape[:-1] + (3, samples.shape[-1]),
+                        dtype=REAL_DTYPE)
+    features[..., 0, :] = np.abs(samples)
+    features[..., 1, :] = np.unwrap(np.angle(samples), axis=-1)
+    features[..., 2, 0] = 0
+    features[..., 2, 1:] = np.diff(features[..., 1, :], axis=-1) / (2*np.pi)
+    return features
+
+
+def cumulants(samples):
+    """
+    Compute the higher-order cumulants of every vector
+
+    The vectors are made zero-mean and the cumulants are normalized by the
+    matching power of C21, the signal power, so they do not depend on the
+    gain. The magnitudes are returned, except for C42 which is real and keeps
+    its sign. At one sample per symbol, C40 and C42 separate 8PSK (0, -1)
+    from 16QAM (0.68, -0.68). Pulse shaping reduces both magnitudes, but C40
+    still tells the two apart.
+
+    Parameters
+    ----------
+      - samples: An (N, nSamps) complex array
+
+    Returns
+    -------
+      - cumulants: An (N, 6) float32 array of the CUMULANTS columns
+    """
+    # Sixth-order moments lose too much precision in complex64
+    x = samples.astype(np.complex128)
+    x -= x.mean(axis=-1, keepdims=True)
+    x2 = x*x
+    power = x.real**2 + x.imag**2
+    m20 = x2.mean(axis=-1)
+    m21 = power.mean(axis=-1)
+    m40 = (x2*x2).mean(axis=-1)
+    m41 = (x2*power).mean(axis=-1)
+    m42 = (power*power).mean(axis=-1)
+    m60 = (x2*x2*x2).mean(axis=-1)
+    m63 = (power*power*power).mean(axis=-1)
+    c40 = m40 - 3*m20**2
+    c41 = m41 - 3*m20*m21
+    c42 = m42 - np.abs(m20)**2 - 2*m21**2
+    c60 = m60 - 15*m20*m40 + 30*m20**3
+    c63 = m63 - 6*m20*m41 - 9*m42*m21 + 18*m20**2*m21 + 12*m21**3
+    c21 = np.where(m21 > 0, m21, 1)
+    result = np.stack([np.abs(m20) / c21,
+                       np.abs(c40) / c21**2,
+                       np.abs(c41) / c21**2,
+                       c42 / c21**2,
+                       np.abs(c60) / c21**3,
+                       np.abs(c63) / c21**3], axis=-1)
+    return result.astype(REAL_DTYPE)
+
+
+# Feature extractors by name
+FEATURES = {
+    'spectrogram': spectrogram,
+    'instantaneous': instantaneous,
+    'cumulants': cumulants,
+}
+
+
+def data_key(dataset):
+    """
+    Return a key that changes whenever the samples or labels of a dataset
+    change, without reading the samples
+
+    The key hashes the size and modification time of the data file together
+    with the contents of the DatasetIndex, or of the SigMF metadata if the
+    recording has no index. Both are small, so computing the key costs the
+    same for any size of recording.
+    """
+    sha256 = hashlib.sha256()
+    stat = os.stat(dataset.filename + '.sigmf-data')
+    sha256.update(f'{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    indexFilename = dataset.filename + INDEX_EXTENSION
+    if not os.path.exists(indexFilename):
+        indexFilename = dataset.filename + '.sigmf-meta'
+    with open(indexFilename, 'rb') as indexFile:
+        for chunk in iter(lambda: indexFile.read(2**24), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class FeatureStore():
+    """
+    Engineered features of a recording, computed once and stored next to it
+    as memory-mapped .npy arrays
+
+    The features are computed in vectorized batches over the selected vectors
+    of the recording, which are typically one partition of a DatasetSplit.
+    Each array is keyed by the feature name, its parameters and the vector
+    indices, and the store is tied to the data_key() of the recording: when
+    the samples or the index change, every stored feature is discarded and
+    computed again on demand.
+
+    Parameters
+    ----------
+      - dataset: The SigMFDataset to extract features from
+      - batchSize: Number of vectors per extraction batch
+    """
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, dataset, batchSize=4096):
+        self.dataset = dataset
+        self.batchSize = batchSize
+        self.directory = dataset.filename + FEATURE_EXTENSION
+        self.dataKey = data_key(dataset)
+        manifestPath = os.path.join(self.directory, self.MANIFEST)
+        if os.path.exists(manifestPath):
+            with open(manifestPath) as manifestFile:
+                if json.load(manifestFile).get('data_key') != self.dataKey:
+                    shutil.rmtree(self.directory)
+        if not os.path.exists(manifestPath):
+            os.makedirs(self.directory, exist_ok=True)
+            with open(manifestPath, 'w') as manifestFile:
+                json.dump({'data_key': self.dataKey}, manifestFile)
+
+    def path(self, name, indices=None, **params):
+        """
+        Return the path the array of a feature is stored at
+
+        Parameters
+        ----------
+          - name: The feature name, a key of FEATURES
+          - indices: The indices of the vectors, or None for every vector
+          - params: Keyword arguments of the feature extractor
+        """
+        key = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+        if indices is not None:
+            key.update(np.asarray(indices, dtype=np.int64).tobytes())
+        return os.path.join(self.directory,
+                            f'{name}-{key.hexdigest()[:16]}.npy')
+
+    def get(self, name, indices=None, **params):
+        """
+        Return a feature of the selected vectors, computing it if it is not
+        stored yet
+
+        Parameters
+        ----------
+          - name: The feature name, a key of FEATURES
+          - indices: The indices of the vectors (e.g. split['train']), or
+            None for every vector
+          - params: Keyword arguments of the feature extractor
+
+        Returns
+        -------
+          - features: A read-only memory-mapped array with one row per
+            selected vector
+        """
+        path = self.path(name, indices, **params)
+        if not os.path.exists(path):
+            self._extract(path, FEATURES[name], indices, params)
+        return np.load(path, mmap_mode='r')
+
+    def _extract(self, path, extractor, indices, params):
+        """
+        Compute a feature batch by batch into a temporary file and rename it
+        into place when it is complete
+        """
+        vectors = self.dataset.vectors
+        if indices is None:
+            indices = np.arange(len(vectors))
+        indices = np.asarray(indices)
+        nSamps = vectors.shape[1]
+        shape = extractor(np.zeros((1, nSamps), vectors.dtype), **params).shape[1:]
+        fd, tmpPath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            out = np.lib.format.open_memmap(
+                tmpPath, mode='w+', dtype=REAL_DTYPE,
+                shape=(len(indices),) + shape)
+            for start in range(0, len(indices), self.batchSize):
+                stop = start + self.batchSize
+                with profiler.stage('features.' + extractor.__name__,
+                                    nVecs=len(indices[start:stop])):
+                    out[start:stop] = extractor(vectors[indices[start:stop]],
+                                                **params)
+            out.flush()
+            del out
+            os.replace(tmpPath, path)
+        except BaseException:
+            os.remove(tmpPath)
+            raise
@@ -0,0 +1,300 @@
+import json
+import numpy as np
+from sigmf import SigMFFile
+from signals.detail import detail
+from signals.emitter import emitter
+
+INDEX_EXTENSION = '.sigmf-index.npz'
+SPLIT_EXTENSION = '.sigmf-split.npz'
+
+
+class DatasetIndex():
+    """
+    A columnar index of the vectors in a SigMF recording
+
+    Each vector is described by its start sample, length, label id, noise
+    voltage and the ids of its signal:detail and signal:emitter records. The
+    label strings and the detail/emitter records are interned, so each
+    distinct record is stored once no matter how many vectors refer to it. The
+    index is saved next to the recording as a NumPy .npz file and loads as
+    plain arrays without parsing any per-vector JSON.
+
+    Attributes
+    ----------
+      - start: int64 start sample of each vector
+      - length: int32 length of each vector
+      - labelId: int16 index into labels for each vector
+      - noiseVoltage: float32 noise voltage (dB) of each vector. NaN if the
+        vector has no noise voltage
+      - detailId: int32 index into details for each vector, -1 if none
+      - emitterId: int32 index into emitters for each vector, -1 if none
+      - labels: The distinct label strings
+      - details: The distinct signal:detail dictionaries
+      - emitters: The distinct signal:emitter dictionaries
+    """
+
+    def __init__(self):
+        self.labels = []
+        self.details = []
+        self.emitters = []
+        self._ids = {'label': {}, 'detail': {}, 'emitter': {}}
+        self._columns = {'start': [], 'length': [], 'labelId': [],
+                         'noiseVoltage': [], 'detailId': [], 'emitterId': []}
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.start)
+
+    @staticmethod
+    def _intern(ids, records, record):
+        """
+        Return the id of a record, adding it to records if it is new
+        """
+        if record is None:
+            return -1
+        key = json.dumps(record, sort_keys=True)
+        if key not in ids:
+            ids[key] = len(records)
+            records.append(record)
+        return ids[key]
+
+    def append(self, start, nVecs, length, label, detailDict=None,
+               emitterDict=None):
+        """
+        Add a block of consecutive, equal-length vectors that share the same
+        metadata
+
+        Parameters
+        ----------
+          - start: The start sample of the first vector
+          - nVecs: The number of vectors in the block
+          - length: The length of each vector in samples
+          - label: The label of the vectors
+          - detailDict: The signal:detail dictionary of the vectors
+          - emitterDict: The signal:emitter dictionary of the vectors
+        """
+        self._arrays = None
+        if label not in self._ids['label']:
+            self._ids['label'][label] = len(self.labels)
+            self.labels.append(label)
+        noiseVoltage = np.nan
+        if detailDict is not None and detail.NOISE_VOLTAGE_KEY in detailDict:
+            noiseVoltage = float(detailDict[detail.NOISE_VOLTAGE_KEY])
+        columns = self._columns
+        columns['start'].append(start + length*np.arange(nVecs, dtype=np.int64))
+        columns['length'].append(np.full((nVecs,), length, dtype=np.int32))
+        columns['labelId'].append(
+            np.full((nVecs,), self._ids['label'][label], dtype=np.int16))
+        columns['noiseVoltage'].append(
+            np.full((nVecs,), noiseVoltage, dtype=np.float32))
+        columns['detailId'].append(np.full(
+            (nVecs,), self._intern(self._ids['detail'], self.details, detailDict),
+            dtype=np.int32))
+        columns['emitterId'].append(np.full(
+            (nVecs,), self._intern(self._ids['emitter'], self.emitters, emitterDict),
+            dtype=np.int32))
+
+    def append_annotation(self, annotation):
+        """
+        Add a single vector described by a SigMF annotation dictionary
+        """
+        self.append(annotation[SigMFFile.START_INDEX_KEY], 1,
+                    annotation[SigMFFile.LENGTH_INDEX_KEY],
+                    annotation.get(SigMFFile.LABEL_KEY, ''),
+                    annotation.get(detail.DETAIL_KEY),
+                    annotation.get(emitter.EMITTER_KEY))
+
+    def _column(self, name):
+        if self._arrays is None:
+            self._arrays = {}
+            for key, chunks in self._columns.items():
+                if len(chunks) > 1:
+                    chunks[:] = [np.concatenate(chunks)]
+                self._arrays[key] = chunks[0] if chunks else np.zeros((0,))
+        return self._arrays[name]
+
+    start = property(lambda self: self._column('start'))
+    length = property(lambda self: self._column('length'))
+    labelId = property(lambda self: self._column('labelId'))
+    noiseVoltage = property(lambda self: self._column('noiseVoltage'))
+    detailId = property(lambda self: self._column('detailId'))
+    emitterId = property(lambda self: self._column('emitterId'))
+
+    def label_names(self):
+        """
+        Return the label string of every vector
+        """
+        return np.asarray(self.labels)[self.labelId]
+
+    def save(self, filename):
+        """
+        Save the index next to the recording
+
+        Parameters
+        ----------
+          - filename: Path of the recording, without the SigMF extension
+        """
+        with open(filename + INDEX_EXTENSION, 'wb') as indexFile:
+            np.savez(indexFile,
+                     start=self.start.astype(np.int64),
+                     length=self.length.astype(np.int32),
+                     labelId=self.labelId.astype(np.int16),
+                     noiseVoltage=self.noiseVoltage.astype(np.float32),
+                     detailId=self.detailId.astype(np.int32),
+                     emitterId=self.emitterId.astype(np.int32),
+                     labels=np.asarray(self.labels, dtype=str),
+                     details=np.asarray([json.dumps(d) for d in self.details],
+                                        dtype=str),
+                     emitters=np.asarray([json.dumps(e) for e in self.emitters],
+                                         dtype=str))
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load the index of a recording
+
+        Parameters
+        ----------
+          - filename: Path of the recording, without the SigMF extension
+        """
+        index = cls()
+        with np.load(filename + INDEX_EXTENSION) as arrays:
+            for name in index._columns:
+                index._columns[name] = [arrays[name]]
+            index.labels = arrays['labels'].tolist()
+            index.details = [json.loads(d) for d in arrays['details']]
+            index.emitters = [json.loads(e) for e in arrays['emitters']]
+        index._ids['label'] = {label: i for i, label in enumerate(index.labels)}
+        for kind, records in (('detail', index.details),
+                              ('emitter', index.emitters)):
+            index._ids[kind] = {json.dumps(record, sort_keys=True): i
+                                for i, record in enumerate(records)}
+        return index
+
+    @classmethod
+    def from_sigmf(cls, sigFile):
+        """
+        Build an index from the annotations of an existing recording
+
+        Parameters
+        ----------
+          - sigFile: A SigMFFile object
+        """
+        index = cls()
+        for annotation in sigFile.get_annotations():
+            index.append_annotation(annotation)
+        return index
+
+
+class DatasetSplit():
+    """
+    Named partitions of the vectors of a recording, such as a train and a
+    test set, stored as sorted int32 vector indices
+
+    Splits are stratified: every (label, noise voltage) pair is divided
+    between the partitions in the same proportions, so each partition covers
+    the whole grid. A split is saved next to the recording, and reloading it
+    gives the same partitions without drawing them again.
+
+    Parameters
+    ----------
+      - partitions: Dictionary mapping each partition name to its indices
+      - fractions: Dictionary mapping each partition name to the fraction of
+        every stratum it was drawn with
+      - seed: The seed the split was drawn with
+    """
+
+    def __init__(self, partitions, fractions=None, seed=None):
+        self.partitions = {name: np.asarray(indices, dtype=np.int32)
+                           for name, indices in partitions.items()}
+        self.fractions = dict(fractions) if fractions is not None else None
+        self.seed = seed
+
+    def __getitem__(self, name):
+        return self.partitions[name]
+
+    def __contains__(self, name):
+        return name in self.partitions
+
+    @property
+    def nVecs(self):
+        """
+        The total number of vectors in the partitions
+        """
+        return sum(len(indices) for indices in self.partitions.values())
+
+    @classmethod
+    def stratified(cls, labelIds, noiseVoltages, fractions, seed=0):
+        """
+        Draw a stratified split
+
+        Parameters
+        ----------
+          - labelIds: The label id of every vector
+          - noiseVoltages: The noise voltage of every vector
+          - fractions: Dictionary mapping each partition name to the fraction
+            of every stratum it gets. The fractions are normalized to sum
+            to 1
+          - seed: The seed of the random assignment
+        """
+        labelIds = np.asarray(labelIds, dtype=np.int64)
+        _, voltageIds = np.unique(np.asarray(noiseVoltages),
+                                  return_inverse=True)
+        nVoltages = int(voltageIds.max()) + 1 if len(voltageIds) else 0
+        _, strata = np.unique(labelIds*nVoltages + voltageIds.ravel(),
+                              return_inverse=True)
+        strata = strata.ravel()
+        nVecs = len(strata)
+        # Shuffle, then group by stratum. The stable sort keeps each stratum
+        # in shuffled order
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(nVecs)
+        order = order[np.argsort(strata[order], kind='stable')]
+        counts = np.bincount(strata)
+        firsts = np.cumsum(counts) - counts
+        sortedStrata = strata[order]
+        rank = np.arange(nVecs) - firsts[sortedStrata]
+        # Rank at which each partition ends, for every stratum
+        weights = np.array(list(fractions.values()), dtype=np.float64)
+        bounds = np.round(np.outer(counts, np.cumsum(weights) / weights.sum()))
+        partition = np.sum(rank[:, np.newaxis] >= bounds[sortedStrata], axis=1)
+        partitions = {name: np.sort(order[partition == iPart])
+                      for iPart, name in enumerate(fractions)}
+        return cls(partitions, fractions, seed)
+
+    def save(self, filename):
+        """
+        Save the split next to the recording
+
+        Parameters
+        ----------
+          - filename: Path of the recording, without the SigMF extension
+        """
+        names = list(self.partitions)
+        fractions = [self.fractions[name] if self.fractions else np.nan
+                     for name in names]
+        with open(filename + SPLIT_EXTENSION, 'wb') as splitFile:
+            np.savez(splitFile,
+                     names=np.asarray(names, dtype=str),
+                     fractions=np.asarray(fractions, dtype=np.float64),
+                     seed=np.asarray(-1 if self.seed is None else self.seed),
+                     **{'partition_' + name: self.partitions[name]
+                        for name in names})
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load the split of a recording
+
+        Parameters
+        ----------
+          - filename: Path of the recording, without the SigMF extension
+        """
+        with np.load(filename + SPLIT_EXTENSION) as arrays:
+            names = arrays['names'].tolist()
+            partitions = {name: arrays['partition_' + name] for name in names}
+            fractions = dict(zip(names, arrays['fractions'].tolist()))
+            seed = int(arrays['seed'])
+        if any(np.isnan(value) for value in fractions.values()):
+            fractions = None
+        return cls(partitions, fractions, None if seed < 0 else seed)
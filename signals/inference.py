@@ -0,0 +1,484 @@
+"""
+Batched inference service for the modulation classifier
+
+The server loads a classifier saved with Classifier.save() and serves it over
+a Unix socket or a localhost TCP port. Each message on the socket is a 4-byte
+big-endian header length, a JSON header and an optional binary payload. A
+classification request has the header
+
+    {"type": "classify", "format": "cf32"}
+
+followed by little-endian cf32 samples, cut into frames of the model's input
+length, or
+
+    {"type": "classify", "format": "sigmf", "meta": <SigMF metadata>}
+
+followed by the contents of the .sigmf-data file, in which case the annotated
+vectors (or the whole recording, cut into frames) are classified. The reply
+holds the class names and one row of class probabilities per frame. A
+{"type": "stats"} request returns the latency percentiles and throughput of
+the server. A connection can send any number of requests.
+
+Requests from every connection go through a single MicroBatcher, which runs
+the model on everything that arrives within maxWait of the oldest pending
+request, so concurrent front-ends share model calls.
+
+Usage:
+
+    python -m signals.inference models/classifier --unix /tmp/classifier.sock
+    python -m signals.inference models/classifier --port 5000
+"""
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+from sigmf import SigMFFile
+from signals.dataset import to_iq
+from signals.precision import COMPLEX_DTYPE, normalize_energy
+
+MODEL_FILENAME = 'model.h5'
+CLASSES_FILENAME = 'classes.json'
+_HEADER = struct.Struct('>I')
+
+
+def waveform_labels():
+    """
+    Return the labels of the waveforms in signals.waveform in class index
+    order, the same order as SigMFDataset.classes
+    """
+    from signals.waveform import LinearFMWaveform, SquareWaveform, bpsk, \
+        qpsk, psk8, qam16
+    return [str(label) for label in np.unique([
+        wave(bandwidth=1e6, pulsewidth=1e-6, sampRate=20e6).label
+        for wave in (LinearFMWaveform, SquareWaveform, bpsk, qpsk, psk8,
+                     qam16)])]
+
+
+class Classifier():
+    """
+    A trained modulation classifier and the labels of its classes
+
+    Parameters
+    ----------
+      - model: A Keras model taking (N, 2, nSamps) float32 I/Q frames
+      - classes: The label string of each class, in class index order
+    """
+
+    def __init__(self, model, classes):
+        self.model = model
+        self.classes = [str(label) for label in classes]
+        self.nSamps = int(model.input_shape[-1])
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Load a classifier saved with save(). If the directory has no class
+        list, the labels of the waveforms in signals.waveform are used
+        """
+        import tensorflow as tf
+        model = tf.keras.models.load_model(
+            os.path.join(directory, MODEL_FILENAME), compile=False)
+        classesPath = os.path.join(directory, CLASSES_FILENAME)
+        if os.path.exists(classesPath):
+            with open(classesPath) as classesFile:
+                classes = json.load(classesFile)
+        else:
+            classes = waveform_labels()
+        return cls(model, classes)
+
+    def save(self, directory):
+        """
+        Save the model and its class labels to a directory
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.model.save(os.path.join(directory, MODEL_FILENAME))
+        with open(os.path.join(directory, CLASSES_FILENAME), 'w') as classesFile:
+            json.dump(self.classes, classesFile)
+
+    def predict(self, frames):
+        """
+        Classify a batch of frames
+
+        Parameters
+        ----------
+          - frames: An (N, nSamps) complex array. Each frame is normalized to
+            unit energy like the training data
+
+        Returns
+        -------
+          - probabilities: An (N, nClasses) float32 array of class
+            probabilities
+        """
+        frames = normalize_energy(np.array(frames, dtype=COMPLEX_DTYPE))
+        return np.asarray(self.model.predict_on_batch(to_iq(frames)),
+                          dtype=np.float32)
+
+
+class LatencyStats():
+    """
+    Request latency percentiles and throughput of a server
+
+    Parameters
+    ----------
+      - window: The number of most recent requests the percentiles are
+        computed over
+    """
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.batchSizes = deque(maxlen=window)
+        self.nRequests = 0
+        self.nFrames = 0
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, latency, nFrames):
+        with self._lock:
+            self.latencies.append(latency)
+            self.nRequests += 1
+            self.nFrames += nFrames
+
+    def record_batch(self, nFrames):
+        with self._lock:
+            self.batchSizes.append(nFrames)
+
+    def summary(self):
+        """
+        Return the latency percentiles (ms), throughput and mean batch size
+        """
+        with self._lock:
+            latencies = np.array(self.latencies)
+            batchSizes = np.array(self.batchSizes)
+            elapsed = time.perf_counter() - self.start
+            nRequests, nFrames = self.nRequests, self.nFrames
+        summary = {
+            'requests': nRequests,
+            'frames': nFrames,
+            'requests_per_sec': nRequests / elapsed if elapsed > 0 else 0.0,
+            'frames_per_sec': nFrames / elapsed if elapsed > 0 else 0.0,
+            'mean_batch_frames': float(batchSizes.mean()) if len(batchSizes) else 0.0,
+        }
+        for name, q in (('p50', 50), ('p99', 99)):
+            summary[f'latency_{name}_ms'] = \
+                float(1e3*np.percentile(latencies, q)) if len(latencies) else None
+        return summary
+
+
+class MicroBatcher():
+    """
+    Combine concurrent classification requests into shared model calls
+
+    A single thread runs the model. It waits for a request, then keeps
+    collecting requests until maxWait has passed since the first one arrived
+    or maxBatch frames are pending, and classifies them in one call. maxWait
+    bounds the latency added by batching.
+
+    Parameters
+    ----------
+      - classifier: The Classifier to run
+      - maxBatch: The largest number of frames per model call
+      - maxWait: The longest time (s) a request waits for others to batch
+        with
+    """
+
+    def __init__(self, classifier, maxBatch=256, maxWait=0.002):
+        self.classifier = classifier
+        self.maxBatch = maxBatch
+        self.maxWait = maxWait
+        self.stats = LatencyStats()
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, frames):
+        """
+        Queue frames for classification
+
+        Parameters
+        ----------
+          - frames: An (N, nSamps) complex array
+
+        Returns
+        -------
+          - future: A Future of the (N, nClasses) class probabilities
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('The batcher is closed')
+            self._pending.append((frames, future, time.perf_counter()))
+            self._condition.notify()
+        return future
+
+    def _next_batch(self):
+        """
+        Wait for requests and return the next batch of them, or None once the
+        batcher is closed
+        """
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0][2] + self.maxWait
+            while not self._closed and \
+                    sum(len(request[0]) for request in self._pending) < self.maxBatch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = [self._pending.popleft()]
+            nFrames = len(batch[0][0])
+            while self._pending and \
+                    nFrames + len(self._pending[0][0]) <= self.maxBatch:
+                batch.append(self._pending.popleft())
+                nFrames += len(batch[-1][0])
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            frames = np.concatenate([request[0] for request in batch])
+            try:
+                probabilities = self.classifier.predict(frames)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            self.stats.record_batch(len(frames))
+            start = 0
+            now = time.perf_counter()
+            for requestFrames, future, arrival in batch:
+                stop = start + len(requestFrames)
+                future.set_result(probabilities[start:stop])
+                self.stats.record(now - arrival, len(requestFrames))
+                start = stop
+
+    def close(self):
+        """
+        Classify the pending requests and stop the batching thread
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+
+def send_message(sock, header, payload=b''):
+    """
+    Send a JSON header and a binary payload
+    """
+    encoded = json.dumps(header).encode()
+    sock.sendall(_HEADER.pack(len(encoded)) + encoded +
+                 _HEADER.pack(len(payload)))
+    if payload:
+        sock.sendall(payload)
+
+
+def _receive_exactly(sock, nBytes):
+    buffer = bytearray(nBytes)
+    view = memoryview(buffer)
+    while view:
+        nReceived = sock.recv_into(view)
+        if nReceived == 0:
+            raise EOFError('Connection closed')
+        view = view[nReceived:]
+    return bytes(buffer)
+
+
+def receive_message(sock):
+    """
+    Receive a JSON header and a binary payload. Raises EOFError if the
+    connection was closed between messages
+    """
+    header = json.loads(_receive_exactly(
+        sock, _HEADER.unpack(_receive_exactly(sock, _HEADER.size))[0]))
+    payload = _receive_exactly(
+        sock, _HEADER.unpack(_receive_exactly(sock, _HEADER.size))[0])
+    return header, payload
+
+
+def decode_frames(header, payload, nSamps):
+    """
+    Convert the payload of a classification request to an (N, nSamps)
+    complex64 array of frames
+    """
+    samples = np.frombuffer(payload, dtype='<c8')
+    if header.get('format', 'cf32') == 'cf32':
+        if len(samples) % nSamps:
+            raise ValueError(f'Expected a multiple of {nSamps} samples, '
+                             f'got {len(samples)}')
+        return samples.reshape(-1, nSamps)
+    if header['format'] != 'sigmf':
+        raise ValueError(f"Unsupported format {header['format']}")
+    meta = header['meta']
+    datatype = meta['global'].get(SigMFFile.DATATYPE_KEY)
+    if datatype != 'cf32_le':
+        raise ValueError(f'Unsupported datatype {datatype}')
+    annotations = meta.get('annotations', [])
+    if not annotations:
+        return samples[:len(samples) // nSamps * nSamps].reshape(-1, nSamps)
+    # Classify the first nSamps samples of each annotated vector
+    starts = np.array([annotation[SigMFFile.START_INDEX_KEY]
+                       for annotation in annotations], dtype=np.intp)
+    if np.any(starts + nSamps > len(samples)):
+        raise ValueError('An annotation is shorter than the model input')
+    return samples[starts[:, np.newaxis] + np.arange(nSamps)]
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """
+    Serve the requests of one connection until it is closed
+    """
+
+    def handle(self):
+        batcher = self.server.batcher
+        classes = batcher.classifier.classes
+        while True:
+            try:
+                header, payload = receive_message(self.request)
+            except (EOFError, ConnectionError):
+                return
+            try:
+                if header.get('type') == 'stats':
+                    reply = batcher.stats.summary()
+                else:
+                    frames = decode_frames(header, payload,
+                                           batcher.classifier.nSamps)
+                    probabilities = batcher.submit(frames).result()
+                    reply = {'classes': classes,
+                             'probabilities': probabilities.tolist(),
+                             'labels': [classes[i] for i in
+                                        np.argmax(probabilities, axis=1)]}
+            except Exception as e:
+                reply = {'error': str(e)}
+            send_message(self.request, reply)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_server(batcher, unixPath=None, host='127.0.0.1', port=0):
+    """
+    Create a threaded server that classifies requests with a MicroBatcher
+
+    Parameters
+    ----------
+      - batcher: The MicroBatcher shared by every connection
+      - unixPath: Path of a Unix socket to listen on. If None, listen on TCP
+      - host: The TCP address to listen on
+      - port: The TCP port to listen on. 0 picks a free port
+
+    Returns
+    -------
+      - server: A socketserver server. Call serve_forever() to run it
+    """
+    if unixPath is not None:
+        if os.path.exists(unixPath):
+            os.remove(unixPath)
+        server = _UnixServer(unixPath, _RequestHandler)
+    else:
+        server = _TCPServer((host, port), _RequestHandler)
+    server.batcher = batcher
+    return server
+
+
+def classify(address, frames):
+    """
+    Classify frames with a running server. Opens a new connection, so keep a
+    socket and use send_message()/receive_message() to send many requests
+
+    Parameters
+    ----------
+      - address: The Unix socket path, or a (host, port) pair
+      - frames: An (N, nSamps) complex array
+
+    Returns
+    -------
+      - reply: The reply dictionary, with the class names, the
+        probabilities and the most likely label of each frame
+    """
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.connect(address)
+        send_message(sock, {'type': 'classify', 'format': 'cf32'},
+                     np.ascontiguousarray(frames, dtype='<c8').tobytes())
+        return receive_message(sock)[0]
+
+
+def argument_parser():
+    parser = ArgumentParser(prog='python -m signals.inference',
+                            description='Batched modulation classifier server')
+    parser.add_argument('model',
+                        help='Directory of a classifier saved with '
+                        'Classifier.save()')
+    parser.add_argument('--unix',
+                        help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='TCP address to listen on [default=%(default)s]')
+    parser.add_argument('--port', type=int, default=5000,
+                        help='TCP port to listen on [default=%(default)r]')
+    parser.add_argument('--max-batch', type=int, default=256,
+                        help='Largest number of frames per model call '
+                        '[default=%(default)r]')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0,
+                        help='Longest time a request waits to be batched '
+                        '(ms) [default=%(default)r]')
+    parser.add_argument('--stats-interval', type=float, default=10.0,
+                        help='Seconds between latency and throughput reports. '
+                        '0 disables them [default=%(default)r]')
+    return parser
+
+
+def main(options=None):
+    args = options if options is not None else argument_parser().parse_args()
+    classifier = Classifier.load(args.model)
+    batcher = MicroBatcher(classifier, args.max_batch, args.max_wait_ms/1e3)
+    server = make_server(batcher, args.unix, args.host, args.port)
+    print(f'Serving {len(classifier.classes)} classes '
+          f'({", ".join(classifier.classes)}) on '
+          f'{args.unix or "%s:%d" % server.server_address[:2]}')
+
+    def report():
+        while True:
+            time.sleep(args.stats_interval)
+            stats = batcher.stats.summary()
+            print(f"{stats['requests']} requests, "
+                  f"{stats['frames_per_sec']:.1f} frames/s, "
+                  f"p50 {stats['latency_p50_ms'] or 0:.2f} ms, "
+                  f"p99 {stats['latency_p99_ms'] or 0:.2f} ms, "
+                  f"{stats['mean_batch_frames']:.1f} frames/batch")
+    if args.stats_interval > 0:
+        threading.Thread(target=report, daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+        if args.unix:
+            os.remove(args.unix)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,308 @@
+import numpy as np
+from signals.cache import LRUCache
+
+# Memory budget of the output schedules cached by each NumpyModulator
+SCHEDULE_CACHE_BYTES = 32*2**20
+
+
+def root_raised_cosine(gain, sampRate, symbolRate, alpha, nTaps):
+    """
+    Design a root-raised cosine filter
+
+    This is a port of gr::filter::firdes::root_raised_cosine, including its
+    float32 tap storage, so the taps match the ones GNU Radio designs for the
+    same parameters.
+
+    Parameters
+    ----------
+      - gain: The overall gain of the filter
+      - sampRate: The sampling rate of the filter (Hz)
+      - symbolRate: The symbol rate (Hz)
+      - alpha: The excess bandwidth (roll-off) factor
+      - nTaps: The number of taps. This is forced to be odd
+
+    Returns
+    -------
+      - taps: A float32 array of filter taps
+    """
+    nTaps = int(nTaps) | 1
+    spb = sampRate / symbolRate
+    taps = np.zeros((nTaps,), dtype=np.float32)
+    for i in range(nTaps):
+        xindx = i - nTaps // 2
+        x1 = np.pi * xindx / spb
+        x2 = 4 * alpha * xindx / spb
+        x3 = x2 * x2 - 1
+        if abs(x3) >= 0.000001:
+            if i != nTaps // 2:
+                num = np.cos((1 + alpha) * x1) + \
+                    np.sin((1 - alpha) * x1) / (4 * alpha * xindx / spb)
+            else:
+                num = np.cos((1 + alpha) * x1) + \
+                    (1 - alpha) * np.pi / (4 * alpha)
+            den = x3 * np.pi
+        else:
+            if alpha == 1:
+                taps[i] = -1
+                continue
+            x3 = (1 - alpha) * x1
+            x2 = (1 + alpha) * x1
+            num = (np.sin(x2) * (1 + alpha) * np.pi -
+                   np.cos(x3) * ((1 - alpha) * np.pi * spb) / (4 * alpha * xindx) +
+                   np.sin(x3) * spb * spb / (4 * alpha * xindx * xindx))
+            den = -32 * np.pi * alpha * alpha * xindx / spb
+        taps[i] = 4 * alpha * num / den
+    scale = np.sum(taps, dtype=np.float64)
+    return (taps.astype(np.float64) * gain / scale).astype(np.float32)
+
+
+class NumpyModulator():
+    """
+    A NumPy implementation of the digital.generic_mod modulator chain used by
+    CommunicationsTransmitter. Bytes are unpacked into symbols (MSB first),
+    mapped through the constellation pre-differential code, differentially
+    encoded, mapped to constellation points and pulse shaped with the same
+    polyphase root-raised cosine resampler as GNU Radio. Every operation is
+    applied to a whole (N, nBytes) batch at once.
+
+    For the same input bytes, the output matches the GNU Radio modulator up
+    to float32 rounding in the filter accumulation.
+
+    Parameters
+    ----------
+      - points: The complex constellation points
+      - preDiffCode: Symbol mapping applied before differential encoding, or
+        None for no mapping
+      - differential: If true, the symbols are differentially encoded
+      - sampsPerSym: Samples per symbol
+      - excessBandwidth: Excess bandwidth of the root-raised cosine filter
+      - nFilts: Number of filters in the polyphase filterbank
+      - taps: Precomputed prototype filter taps. If None, the taps are
+        designed the same way as in digital.generic_mod
+    """
+
+    def __init__(self, points, preDiffCode=None, differential=False,
+                 sampsPerSym=2, excessBandwidth=0.35, nFilts=32, taps=None):
+        self.points = np.asarray(points, dtype=np.complex64)
+        self.arity = len(self.points)
+        self.bitsPerSym = int(np.log2(self.arity))
+        if preDiffCode is not None and len(preDiffCode) > 0:
+            self.preDiffCode = np.asarray(preDiffCode, dtype=np.intp)
+        else:
+            self.preDiffCode = None
+        self.differential = differential
+        self.sampsPerSym = sampsPerSym
+        self.excessBandwidth = excessBandwidth
+        self.nFilts = nFilts
+        if taps is None:
+            # Same filter design as digital.generic_mod
+            taps = root_raised_cosine(
+                nFilts, nFilts, 1.0, excessBandwidth, nFilts*11*int(sampsPerSym))
+        self.taps = np.asarray(taps, dtype=np.float32)
+        self._create_filterbank()
+        # Output schedules of the resampler, keyed by the number of symbols.
+        # The cache is bounded, since every input length has its own schedule
+        self._schedules = LRUCache(SCHEDULE_CACHE_BYTES)
+
+    @classmethod
+    def from_waveform(cls, waveform, taps=None):
+        """
+        Create a modulator with the same parameters as the GNU Radio modulator
+        that CommunicationsTransmitter builds for the given waveform
+
+        Parameters
+        ----------
+          - waveform: The CommunicationsWaveform object to modulate
+          - taps: Precomputed prototype filter taps
+        """
+        constellation = waveform.constellation
+        preDiffCode = None
+        if constellation.apply_pre_diff_code():
+            preDiffCode = constellation.pre_diff_code()
+        return cls(constellation.points(),
+                   preDiffCode=preDiffCode,
+                   differential=waveform.differential,
+                   sampsPerSym=waveform.sampsPerSym,
+                   excessBandwidth=waveform.excessBandwidth,
+                   taps=taps)
+
+    def _create_filterbank(self):
+        """
+        Split the prototype filter into nFilts polyphase filters and their
+        derivative filters, as done by pfb_arb_resampler_ccf
+        """
+        rate = float(self.sampsPerSym)
+        self.decRate = int(np.floor(self.nFilts / rate))
+        self.fltRate = np.float32(self.nFilts / rate - self.decRate)
+        self.tapsPerFilter = int(np.ceil(len(self.taps) / self.nFilts))
+        padded = np.zeros((self.nFilts*self.tapsPerFilter,), dtype=np.float32)
+        padded[:len(self.taps)] = self.taps
+        diffTaps = np.zeros_like(padded)
+        diffTaps[:len(self.taps)-1] = np.diff(self.taps)
+        # Row i holds taps[i + j*nFilts] for j = 0, ..., tapsPerFilter-1
+        self.filterbank = padded.reshape(self.tapsPerFilter, self.nFilts).T
+        self.diffFilterbank = diffTaps.reshape(
+            self.tapsPerFilter, self.nFilts).T
+        self.firstFilter = (len(self.taps) // 2) % self.nFilts
+        # Output samples produced while the filter fills with symbols
+        self.transient = int(np.ceil((self.tapsPerFilter-1)*self.sampsPerSym))
+
+    def _schedule(self, nSyms):
+        """
+        Compute which input symbol, filter arm and interpolation weight the
+        resampler uses for each output sample when nSyms symbols are filtered.
+        The schedule does not depend on the data, so it is cached per input
+        length, within SCHEDULE_CACHE_BYTES.
+        """
+        return self._schedules.get(
+            nSyms, lambda: self._create_schedule(nSyms),
+            nBytes=lambda schedule: sum(a.nbytes for a in schedule))
+
+    def _create_schedule(self, nSyms):
+        """
+        Simulate the resampler over nSyms symbols to build its schedule
+        """
+        inputIndex = []
+        filterIndex = []
+        accumulator = []
+        iIn = 0
+        j = self.firstFilter
+        acc = np.float32(0)
+        while iIn < nSyms:
+            while j < self.nFilts:
+                inputIndex.append(iIn)
+                filterIndex.append(j)
+                accumulator.append(acc)
+                acc = np.float32(acc + self.fltRate)
+                j += self.decRate + int(np.floor(acc))
+                acc = np.float32(np.fmod(acc, np.float32(1)))
+            iIn += j // self.nFilts
+            j = j % self.nFilts
+        inputIndex = np.array(inputIndex, dtype=np.intp)
+        filterIndex = np.array(filterIndex, dtype=np.intp)
+        accumulator = np.array(accumulator, dtype=np.float32)
+        # Effective filter for each output sample
+        coeffs = self.filterbank[filterIndex] + \
+            accumulator[:, np.newaxis]*self.diffFilterbank[filterIndex]
+        coeffs.flags.writeable = False
+        return inputIndex, coeffs
+
+    def symbols(self, data):
+        """
+        Map packed bytes to constellation symbols
+
+        Parameters
+        ----------
+          - data: An (N, nBytes) uint8 array of packed data bytes
+
+        Returns
+        -------
+          - symbols: An (N, nSyms) complex64 array of constellation points
+        """
+        data = np.atleast_2d(np.asarray(data, dtype=np.uint8))
+        bits = np.unpackbits(data, axis=1)
+        nSyms = bits.shape[1] // self.bitsPerSym
+        bits = bits[:, :nSyms*self.bitsPerSym].reshape(
+            data.shape[0], nSyms, self.bitsPerSym)
+        weights = 1 << np.arange(self.bitsPerSym-1, -1, -1)
+        indices = bits.astype(np.intp) @ weights
+        if self.preDiffCode is not None:
+            indices = self.preDiffCode[indices]
+        if self.differential:
+            indices = np.cumsum(indices, axis=1) % self.arity
+        return self.points[indices]
+
+    def pulse_shape(self, symbols):
+        """
+        Apply the polyphase root-raised cosine interpolating filter
+
+        Parameters
+        ----------
+          - symbols: An (N, nSyms) complex array of symbols
+
+        Returns
+        -------
+          - data: An (N, nOut) complex64 array of pulse shaped samples
+        """
+        symbols = np.atleast_2d(symbols).astype(np.complex64, copy=False)
+        nVecs, nSyms = symbols.shape
+        inputIndex, coeffs = self._schedule(nSyms)
+        nTaps = self.tapsPerFilter
+        # Zero history in front of the first symbol, as in the GNU Radio block
+        padded = np.zeros((nVecs, nSyms+nTaps-1), dtype=np.complex64)
+        padded[:, nTaps-1:] = symbols
+        data = np.zeros((nVecs, len(inputIndex)), dtype=np.complex64)
+        for iTap in range(nTaps):
+            data += coeffs[:, iTap] * padded[:, inputIndex + nTaps-1-iTap]
+        return data
+
+    def modulate(self, data):
+        """
+        Modulate a batch of packed data bytes
+
+        Parameters
+        ----------
+          - data: An (N, nBytes) uint8 array of packed data bytes
+
+        Returns
+        -------
+          - data: An (N, nOut) complex64 array of modulated samples
+        """
+        return self.pulse_shape(self.symbols(data))
+
+    def bytes_required(self, nSamps):
+        """
+        Return the number of data bytes needed to produce nSamps output samples
+
+        Parameters
+        ----------
+          - nSamps: The number of output samples
+        """
+        nSyms = int(np.ceil(nSamps / self.sampsPerSym)) + 1
+        return int(np.ceil(nSyms*self.bitsPerSym / 8))
+
+    def samples_required(self, nSamps, offset=0, nTransient=0):
+        """
+        Return the number of output samples needed to cut a window of nSamps
+        fully pulse shaped samples
+
+        Parameters
+        ----------
+          - nSamps: The number of samples in the window
+          - offset: The start of the window, counted from the first sample
+            after the filter transient
+          - nTransient: Extra samples in front of the window, e.g. to let the
+            filters of a channel settle
+
+        Returns
+        -------
+          - nOut: The number of output samples to generate. The window is
+            the last nSamps of them
+        """
+        return self.transient + nTransient + offset + nSamps
+
+    def sample_batch(self, nVecs, nSamps, data=None, seed=None):
+        """
+        Generate a batch of modulated vectors
+
+        Parameters
+        ----------
+          - nVecs: The number of vectors to generate
+          - nSamps: The number of samples in each vector
+          - data: An (nVecs, nBytes) uint8 array of data bytes to modulate.
+            If None, uniformly random bytes are drawn
+          - seed: The seed used to draw random bytes
+
+        Returns
+        -------
+          - data: An (nVecs, nSamps) complex64 array
+        """
+        if data is None:
+            rng = np.random.default_rng(seed)
+            data = rng.integers(0, 256, (nVecs, self.bytes_required(nSamps)),
+                                dtype=np.uint8)
+        samples = self.modulate(data)
+        if samples.shape[1] < nSamps:
+            raise ValueError(
+                f'{data.shape[1]} bytes per vector cannot produce {nSamps} samples')
+        return samples[:, :nSamps]
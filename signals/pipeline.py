@@ -0,0 +1,98 @@
+import numpy as np
+import tensorflow as tf
+from signals.dataset import SigMFDataset
+
+
+def make_dataset(filename, indices=None, batchSize=1024, shuffle=True,
+                 nShards=64, shuffleBuffer=8192, seed=None, workerIndex=0,
+                 nWorkers=1):
+    """
+    Build a tf.data input pipeline that reads training examples straight from
+    a SigMF recording, without loading the recording into memory
+
+    The selected vectors are grouped into contiguous runs, and the runs are
+    cut into shards of at most 1/nShards of the selection. Each shard is read
+    with a FixedLengthRecordDataset, so only the selected records are read
+    from the recording. When shuffling, the shard order is
+    shuffled every epoch, several shards are interleaved in parallel, and the
+    interleaved examples pass through a shuffle buffer. Batches of raw cf32
+    records are decoded into (batchSize, 2, nSamps) float32 frames in parallel
+    and prefetched.
+
+    Parameters
+    ----------
+      - filename: Path of the recording, without the SigMF extension
+      - indices: Indices of the vectors to use (e.g. a training split). If
+        None, every vector is used
+      - batchSize: Number of examples per batch
+      - shuffle: If true, shuffle the examples every epoch
+      - nShards: Number of shards a contiguous selection is split into.
+        Scattered selections give one shard per run of consecutive vectors
+      - shuffleBuffer: Number of examples in the shuffle buffer
+      - seed: Seed for the shard and example shuffles
+      - workerIndex: Index of this input pipeline when training on several
+        workers. Each worker reads a disjoint subset of the shards
+      - nWorkers: Total number of input pipelines
+
+    Returns
+    -------
+      - dataset: A tf.data.Dataset of (frames, oneHotLabels) batches
+    """
+    sigDataset = SigMFDataset(filename)
+    nVecs = len(sigDataset)
+    nSamps = sigDataset.nSamps
+    nClasses = len(sigDataset.classes)
+    start = sigDataset.index.start
+    if nVecs > 1 and start[1] - start[0] != nSamps:
+        raise ValueError('Vectors must be contiguous in the recording')
+    recordBytes = nSamps*sigDataset.data.itemsize
+    headerBytes = int(start[0])*sigDataset.data.itemsize if nVecs else 0
+    dataFilename = filename + '.sigmf-data'
+    totalRecords = (sigDataset.data.shape[0] - int(start[0] if nVecs else 0)) \
+        // nSamps
+
+    if indices is None:
+        selected = np.arange(nVecs, dtype=np.int64)
+    else:
+        selected = np.unique(np.asarray(indices, dtype=np.int64))
+    labelIds = tf.constant(sigDataset.labelIds, dtype=tf.int32)
+    # Shards are contiguous runs of selected vectors, so records outside the
+    # selection are never read. Runs longer than an even share of the
+    # selection are split further
+    runs = np.split(selected, np.flatnonzero(np.diff(selected) != 1) + 1)
+    shardSize = max(-(-len(selected) // nShards), 1)
+    bounds = [(run[i], run[min(i+shardSize, len(run))-1] + 1)
+              for run in runs for i in range(0, len(run), shardSize)]
+    shardBounds = tf.constant(np.array(bounds, dtype=np.int64).reshape(-1, 2))
+
+    def read_shard(shard):
+        lo, hi = shard[0], shard[1]
+        records = tf.data.FixedLengthRecordDataset(
+            dataFilename, recordBytes,
+            header_bytes=headerBytes + lo*recordBytes,
+            footer_bytes=(totalRecords - hi)*recordBytes)
+        ids = tf.data.Dataset.range(lo, hi)
+        return tf.data.Dataset.zip((records, ids)) \
+            .map(lambda record, i: (record, tf.gather(labelIds, i)))
+
+    def decode(records, labels):
+        frames = tf.reshape(tf.io.decode_raw(records, tf.float32),
+                            [-1, nSamps, 2])
+        return tf.transpose(frames, [0, 2, 1]), tf.one_hot(labels, nClasses)
+
+    shards = tf.data.Dataset.from_tensor_slices(shardBounds)
+    shards = shards.shard(nWorkers, workerIndex)
+    if shuffle:
+        shards = shards.shuffle(max(len(bounds), 1), seed=seed,
+                                reshuffle_each_iteration=True)
+    examples = shards.interleave(
+        read_shard,
+        cycle_length=tf.data.AUTOTUNE if shuffle else 1,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not shuffle)
+    if shuffle:
+        examples = examples.shuffle(shuffleBuffer, seed=seed,
+                                    reshuffle_each_iteration=True)
+    return examples.batch(batchSize) \
+        .map(decode, num_parallel_calls=tf.data.AUTOTUNE) \
+        .prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,192 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from gnuradio import gr, blocks
+from signals.channel import Channel
+from signals.precision import COMPLEX_DTYPE
+from signals.waveform import RadarWaveform, cut_window
+
+
+class Flowgraph():
+    """
+    A transmitter -> Channel -> vector sink top block that captures one
+    vector per run
+
+    Every block of the flowgraph is a native GNU Radio block, so a run does
+    not take the GIL until the window is cut out of the captured samples.
+
+    Every random source in the flowgraph (the data bits, the channel fading
+    and noise, and the window offsets) is seeded from the seed of the
+    instance, so flowgraphs with different seeds produce independent vectors.
+
+    Parameters
+    ----------
+      - waveform: The waveform object to transmit. Radar waveforms transmit
+        the data passed to run(), and communications waveforms modulate
+        random data
+      - nSamps: The number of samples in each captured vector
+      - sampRate: The sample rate of the waveform (Hz)
+      - noisePower: The noise power of the channel (dB)
+      - seed: The seed of the flowgraph
+      - channelParams: Keyword arguments of Channel other than the sample
+        rate, noise power and seed
+    """
+
+    def __init__(self, waveform, nSamps, sampRate, noisePower, seed,
+                 channelParams=None):
+        # Seeds of the data source, channel and window offsets
+        sourceSeed, channelSeed, sinkSeed = \
+            np.random.SeedSequence(seed).generate_state(3) >> 1
+        self.waveform = waveform
+        self.nSamps = nSamps
+        self.rng = np.random.default_rng(sinkSeed)
+        self.tb = gr.top_block()
+        self.channel = Channel(sampRate, noisePower=noisePower,
+                               seed=int(channelSeed), **channelParams)
+        if isinstance(waveform, RadarWaveform):
+            self.tx = waveform.transmitter(repeat=False)
+        else:
+            # Every instance needs its own modulator blocks. The window starts
+            # once the channel filters have settled
+            self.tx = waveform.transmitter(nSamps=nSamps, channel=self.channel,
+                                           shared=False, seed=int(sourceSeed))
+        self.sink = blocks.vector_sink_c()
+        self.tb.connect(self.tx, self.channel, self.sink)
+
+    def run(self, data=None):
+        """
+        Reset the head blocks and window of the flowgraph and capture one
+        vector
+
+        Parameters
+        ----------
+          - data: The samples to transmit, for radar waveforms
+
+        Returns
+        -------
+          - vector: An (nSamps,) complex64 array
+        """
+        if isinstance(self.waveform, RadarWaveform):
+            self.tx.set_data(data)
+            self.tx.reset()
+            offset = self.rng.integers(0, max(len(data)-self.nSamps, 0),
+                                       endpoint=True)
+        else:
+            self.tx.reset(offset=self.rng.integers(self.waveform.sampsPerSym))
+            offset = self.tx.nLead
+        self.sink.reset()
+        self.tb.run()
+        return cut_window(self.sink.data(), offset, self.nSamps)
+
+
+class FlowgraphPool():
+    """
+    A pool of independent flowgraphs of one waveform, run concurrently from a
+    thread pool in a single process
+
+    A single flowgraph run is a short burst of work on a few cores. The
+    flowgraphs are made of native blocks only, and the GNU Radio scheduler
+    runs them without the GIL, so running several flowgraphs from threads
+    keeps every core busy without paying the cost of spawning worker
+    processes and importing GNU Radio in each of them. A Python block such
+    as WindowSink would take the GIL on every call and serialize the
+    flowgraphs. Only resetting a flowgraph and cutting the window out of its
+    output hold the GIL. The flowgraphs are built once and reused for every
+    vector. The transmitter.*.pool and transmitter.*.pool1 benchmark cases
+    measure the speedup over a single flowgraph.
+
+    Vector i is always captured by flowgraph i % nInstances, and each
+    flowgraph captures its vectors in order, so the output only depends on
+    the seed and the number of instances, not on thread scheduling.
+
+    Parameters
+    ----------
+      - waveform: The waveform object to transmit
+      - nSamps: The number of samples in each captured vector
+      - sampRate: The sample rate of the waveform (Hz)
+      - noisePower: The noise power of the channel (dB)
+      - nInstances: The number of flowgraphs. If None, one per CPU
+      - seed: The base seed. Instance i is seeded with (seed, i)
+      - channelParams: Keyword arguments of Channel other than the sample
+        rate, noise power and seed. If None, the channel used in the
+        synthesis notebook is used
+    """
+
+    def __init__(self, waveform, nSamps, sampRate, noisePower, nInstances=None,
+                 seed=0, channelParams=None):
+        if nInstances is None:
+            nInstances = os.cpu_count() or 1
+        if channelParams is None:
+            channelParams = {'nSinusoids': 8, 'doppFreq': 1, 'losModel': True,
+                             'kFactor': 4, 'delays': [0.0, 0.9, 1.3],
+                             'mags': [1, 0.99, 0.97], 'nTapsMultipath': 8}
+        self.nSamps = nSamps
+        self.instances = [
+            Flowgraph(waveform, nSamps, sampRate, noisePower, [seed, i],
+                      channelParams)
+            for i in range(nInstances)]
+        self.executor = ThreadPoolExecutor(max_workers=nInstances)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.instances)
+
+    def set_noise_power(self, noisePower):
+        """
+        Change the noise power (dB) of every flowgraph
+        """
+        for instance in self.instances:
+            instance.channel.set_noise_power(noisePower)
+
+    def run(self, nVecs, data=None):
+        """
+        Capture nVecs vectors, spread over the flowgraphs
+
+        Parameters
+        ----------
+          - nVecs: The number of vectors to capture
+          - data: For radar waveforms, a sequence of nVecs sample arrays to
+            transmit, one per vector
+
+        Returns
+        -------
+          - vectors: An (nVecs, nSamps) complex64 array
+        """
+        if data is not None and len(data) != nVecs:
+            raise ValueError(f'Expected {nVecs} data vectors, got {len(data)}')
+        out = np.empty((nVecs, self.nSamps), dtype=COMPLEX_DTYPE)
+        nInstances = len(self.instances)
+
+        def capture(iInstance):
+            instance = self.instances[iInstance]
+            for iVec in range(iInstance, nVecs, nInstances):
+                out[iVec] = instance.run(
+                    data[iVec] if data is not None else None)
+
+        for future in [self.executor.submit(capture, i)
+                       for i in range(min(nInstances, nVecs))]:
+            future.result()
+        return out
+
+    def counted_blocks(self):
+        """
+        Return the (name, block) pairs of the blocks of every flowgraph, for
+        profiler.record_blocks()
+        """
+        named = []
+        for i, instance in enumerate(self.instances):
+            blocks = instance.tx.counted_blocks() + \
+                instance.channel.counted_blocks() + [('sink', instance.sink)]
+            named += [(f'{i}.{name}', block) for name, block in blocks]
+        return named
+
+    def close(self):
+        """
+        Shut down the thread pool
+        """
+        self.executor.shutdown()
@@ -0,0 +1,71 @@
+"""
+Precision policy of the package
+
+Samples are complex64 and real-valued tensors are float32 at every stage:
+waveform generation, channel application, normalization, storage (cf32_le)
+and the (N, 2, nSamps) training tensors. Parameters such as frequencies,
+times and phases are computed in float64 where precision matters, and only
+converted to samples at the end, without a complex128 intermediate.
+"""
+import numpy as np
+
+# Dtype of complex samples
+COMPLEX_DTYPE = np.dtype(np.complex64)
+# Dtype of real-valued samples, gains and training tensors
+REAL_DTYPE = np.dtype(np.float32)
+
+
+def as_complex(data):
+    """
+    Return data as a complex64 array, without copying if it already is one
+
+    Parameters
+    ----------
+      - data: An array-like of samples
+    """
+    return np.asarray(data).astype(COMPLEX_DTYPE, copy=False)
+
+
+def phasor(phase, out=None):
+    """
+    Compute exp(1j*phase) as complex64
+
+    The cosine and sine are evaluated at the precision of phase and written
+    straight into the real and imaginary parts of the output, so no
+    complex128 array is created.
+
+    Parameters
+    ----------
+      - phase: An array of phases (radians)
+      - out: An optional complex64 array with the shape of phase to write to
+
+    Returns
+    -------
+      - out: A complex64 array of unit phasors
+    """
+    phase = np.asarray(phase)
+    if out is None:
+        out = np.empty(phase.shape, dtype=COMPLEX_DTYPE)
+    np.cos(phase, out=out.real, casting='same_kind')
+    np.sin(phase, out=out.imag, casting='same_kind')
+    return out
+
+
+def normalize_energy(data):
+    """
+    Scale every vector (along the last axis) to unit energy in place.
+    Vectors with zero energy are left unchanged
+
+    Parameters
+    ----------
+      - data: A writable complex64 array
+
+    Returns
+    -------
+      - data: The normalized array
+    """
+    energy = np.einsum('...i,...i->...', data.real, data.real) + \
+        np.einsum('...i,...i->...', data.imag, data.imag)
+    scale = np.sqrt(np.where(energy > 0, energy, 1), dtype=REAL_DTYPE)
+    data /= scale[..., np.newaxis]
+    return data
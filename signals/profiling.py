@@ -0,0 +1,316 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+import numpy as np
+
+
+def enable_performance_counters():
+    """
+    Turn on GNU Radio's per-block performance counters. This has to be done
+    before any block is created
+    """
+    from gnuradio import gr
+    prefs = gr.prefs()
+    prefs.set_bool('PerfCounters', 'on', True)
+    prefs.set_bool('PerfCounters', 'export', False)
+
+
+def block_counters(namedBlocks):
+    """
+    Read the performance counters of GNU Radio blocks
+
+    Parameters
+    ----------
+      - namedBlocks: (name, block) pairs. Blocks without performance counters
+        (such as hierarchical blocks) are skipped
+
+    Returns
+    -------
+      - counters: A dictionary mapping each block name to its total work time
+        (s), number of items produced and throughput
+    """
+    from gnuradio import gr
+    ticksPerSecond = gr.high_res_timer_tps()
+    counters = {}
+    for name, block in namedBlocks:
+        if not hasattr(block, 'pc_work_time_total'):
+            continue
+        workTime = block.pc_work_time_total() / ticksPerSecond
+        nProduced = block.pc_nproduced()
+        counters[name] = {
+            'work_time_s': workTime,
+            'nproduced': nProduced,
+            'samples_per_sec': nProduced / workTime if workTime > 0 else None,
+        }
+    return counters
+
+
+class _NullStage():
+    """
+    The context returned by Profiler.stage() while profiling is disabled
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage():
+    """
+    A context that records the wall and CPU time spent inside it
+    """
+    __slots__ = ('profiler', 'name', 'args', 'wallStart', 'cpuStart')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.cpuStart = time.process_time()
+        self.wallStart = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        wall = time.perf_counter() - self.wallStart
+        cpu = time.process_time() - self.cpuStart
+        self.profiler.events.append(
+            (self.name, self.wallStart, wall, cpu, os.getpid(),
+             threading.get_ident(), self.args))
+        return False
+
+
+class Profiler():
+    """
+    Opt-in wall clock, CPU time and GNU Radio block timing of named stages
+
+    Code is instrumented by wrapping each stage in a with profiler.stage(name)
+    block. While the profiler is disabled, stage() returns a shared no-op
+    context, so instrumented code runs at full speed. When it is enabled,
+    every stage records its start time, wall time and CPU time. The CPU time
+    is that of the whole process, so it includes the GNU Radio scheduler
+    threads of a flowgraph run.
+
+    Profiling is enabled with enable(), or by setting the SIGNALS_PROFILE
+    environment variable before signals is imported. Stage names are dotted,
+    e.g. 'channel.cfo', and the part before the first dot is used as the trace
+    category.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.blocks = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+    def enable(self, performanceCounters=False):
+        """
+        Start recording stages
+
+        Parameters
+        ----------
+          - performanceCounters: If true, also turn on the GNU Radio block
+            performance counters. Only blocks created afterwards keep counters
+        """
+        if performanceCounters:
+            enable_performance_counters()
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stop recording stages. Recorded stages are kept
+        """
+        self.enabled = False
+
+    def reset(self):
+        """
+        Discard every recorded stage and block counter
+        """
+        with self._lock:
+            self.events = []
+            self.blocks.clear()
+
+    def stage(self, name, **args):
+        """
+        Return a context manager that times a stage
+
+        Parameters
+        ----------
+          - name: The name of the stage
+          - args: Extra values stored with the stage in the trace
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, args)
+
+    def profiled(self, name):
+        """
+        Decorator that times every call of a function as a stage
+        """
+        def decorator(fn):
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Stage(self, name, {}):
+                    return fn(*args, **kwargs)
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            wrapper.__wrapped__ = fn
+            return wrapper
+        return decorator
+
+    def record_blocks(self, stage, namedBlocks):
+        """
+        Add the performance counters of GNU Radio blocks to the totals of a
+        stage. The counters accumulate over the lifetime of a block, so call
+        this once per block, after its last flowgraph run
+
+        Parameters
+        ----------
+          - stage: The stage the blocks ran in
+          - namedBlocks: (name, block) pairs of the blocks to record
+        """
+        if not self.enabled:
+            return
+        counters = block_counters(namedBlocks)
+        with self._lock:
+            for name, counter in counters.items():
+                totals = self.blocks[stage + '/' + name]
+                totals['work_time_s'] += counter['work_time_s']
+                totals['nproduced'] += counter['nproduced']
+
+    def drain(self):
+        """
+        Return and discard the recorded stages and block counters, so they
+        can be sent to the profiler of another process with merge()
+        """
+        with self._lock:
+            events, self.events = self.events, []
+            blocks = {name: dict(totals) for name, totals in self.blocks.items()}
+            self.blocks.clear()
+        return events, blocks
+
+    def merge(self, events, blocks):
+        """
+        Add stages and block counters recorded by another profiler
+        """
+        with self._lock:
+            self.events.extend(events)
+            for name, counter in blocks.items():
+                for key, value in counter.items():
+                    self.blocks[name][key] += value
+
+    def summary(self):
+        """
+        Summarize the recorded stages
+
+        Returns
+        -------
+          - stages: One dictionary per stage name with the number of calls,
+            total and per-call wall time, total CPU time and the share of the
+            total wall time, sorted by decreasing total wall time. Nested
+            stages are counted in their parents as well, and stages recorded
+            by parallel workers overlap, so the shares can add up to more
+            than 1
+          - blocks: The block counter totals, keyed by 'stage/block'
+        """
+        with self._lock:
+            events = list(self.events)
+            blocks = {name: dict(totals) for name, totals in self.blocks.items()}
+        walls = defaultdict(list)
+        cpus = defaultdict(float)
+        for name, _, wall, cpu, _, _, _ in events:
+            walls[name].append(wall)
+            cpus[name] += cpu
+        if events:
+            start = min(event[1] for event in events)
+            elapsed = max(event[1] + event[2] for event in events) - start
+        else:
+            elapsed = 0
+        stages = []
+        for name, wall in walls.items():
+            wall = np.array(wall)
+            stages.append({
+                'stage': name,
+                'calls': len(wall),
+                'wall_s': float(wall.sum()),
+                'wall_mean_ms': float(1e3*wall.mean()),
+                'wall_p99_ms': float(1e3*np.percentile(wall, 99)),
+                'cpu_s': cpus[name],
+                'share': float(wall.sum() / elapsed) if elapsed > 0 else 0.0,
+            })
+        stages.sort(key=lambda row: row['wall_s'], reverse=True)
+        for totals in blocks.values():
+            totals['samples_per_sec'] = (
+                totals['nproduced'] / totals['work_time_s']
+                if totals['work_time_s'] > 0 else None)
+        return stages, blocks
+
+    def summary_table(self):
+        """
+        Format the summary as a text table
+        """
+        stages, blocks = self.summary()
+        lines = [f"{'stage':<32} {'calls':>8} {'wall (s)':>10} "
+                 f"{'mean (ms)':>10} {'p99 (ms)':>10} {'cpu (s)':>10} "
+                 f"{'share':>7}"]
+        for row in stages:
+            lines.append(f"{row['stage']:<32} {row['calls']:>8} "
+                         f"{row['wall_s']:>10.3f} {row['wall_mean_ms']:>10.3f} "
+                         f"{row['wall_p99_ms']:>10.3f} {row['cpu_s']:>10.3f} "
+                         f"{row['share']:>7.1%}")
+        if blocks:
+            lines.append('')
+            lines.append(f"{'block':<48} {'work (s)':>10} {'items':>12} "
+                         f"{'items/s':>10}")
+            for name, totals in sorted(blocks.items()):
+                rate = totals['samples_per_sec']
+                lines.append(f"{name:<48} {totals['work_time_s']:>10.3f} "
+                             f"{int(totals['nproduced']):>12} "
+                             f"{rate if rate is not None else float('nan'):>10.3g}")
+        return '\n'.join(lines)
+
+    def trace(self):
+        """
+        Return the recorded stages in the Chrome trace event format, which can
+        be opened in chrome://tracing or Perfetto
+        """
+        with self._lock:
+            events = list(self.events)
+        traceEvents = []
+        for name, start, wall, cpu, pid, tid, args in events:
+            eventArgs = {'cpu_ms': 1e3*cpu}
+            eventArgs.update(args)
+            traceEvents.append({
+                'name': name,
+                'cat': name.split('.')[0],
+                'ph': 'X',
+                'ts': 1e6*start,
+                'dur': 1e6*wall,
+                'pid': pid,
+                'tid': tid,
+                'args': eventArgs,
+            })
+        stages, blocks = self.summary()
+        return {'traceEvents': traceEvents, 'displayTimeUnit': 'ms',
+                'stages': stages, 'blocks': blocks}
+
+    def save(self, filename):
+        """
+        Write the trace, summary and block counters to a JSON file
+        """
+        with open(filename, 'w') as traceFile:
+            json.dump(self.trace(), traceFile, default=str)
+
+
+# Process-wide profiler used by the instrumented modules
+profiler = Profiler()
+if os.environ.get('SIGNALS_PROFILE'):
+    profiler.enable()
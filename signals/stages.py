@@ -0,0 +1,162 @@
+import queue
+import threading
+import time
+from signals.profiling import profiler
+
+# Marks the end of the items passed between stages
+_DONE = object()
+
+
+class StagePipeline():
+    """
+    Run a chain of processing stages concurrently, each on its own thread,
+    connected by bounded queues
+
+    The first stage is an iterable that produces the items, such as the
+    parameters of each vector. Each following stage is a function that takes
+    the item produced by the stage before it and returns the item passed to
+    the next stage, or None to drop it. The return values of the last stage
+    are discarded, so it is typically a writer. Items go through every stage
+    in the order they were produced.
+
+    While one stage works on an item, the others work on the items before and
+    after it. Most NumPy operations release the GIL, and so does the GNU
+    Radio scheduler while it runs native blocks, so a flowgraph run overlaps
+    with the Python bookkeeping of the other stages and the throughput is set
+    by the slowest stage. A Python block such as WindowSink takes the GIL on
+    every call and serializes the flowgraph with the other stages, so end
+    flowgraphs in a native sink such as blocks.vector_sink_c. The bounded
+    queues keep a fast stage from running ahead of a slow one, so memory use
+    is set by maxQueue rather than by the number of items.
+
+    The stages run on different threads, so each item should carry its own
+    data, and objects shared between items must not be modified.
+
+    Parameters
+    ----------
+      - stages: (name, stage) pairs. The first stage is an iterable and the
+        others are functions of one item
+      - maxQueue: The maximum number of items waiting between two stages
+    """
+
+    def __init__(self, stages, maxQueue=8):
+        self.stages = list(stages)
+        if len(self.stages) < 2:
+            raise ValueError('A pipeline needs a source and at least one stage')
+        self.maxQueue = maxQueue
+        self.stats = {}
+
+    def _put(self, output, item, stop):
+        """
+        Put an item on a queue, giving up if the pipeline is stopped
+        """
+        while not stop.is_set():
+            try:
+                output.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, inputQueue, stop):
+        """
+        Take an item from a queue. Returns _DONE if the pipeline is stopped
+        """
+        while not stop.is_set():
+            try:
+                return inputQueue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _source(self, name, items, output, stop, errors):
+        stats = self.stats[name]
+        try:
+            iterator = iter(items)
+            while not stop.is_set():
+                start = time.perf_counter()
+                with profiler.stage(name):
+                    item = next(iterator, _DONE)
+                stats['busy_s'] += time.perf_counter() - start
+                if item is _DONE:
+                    break
+                stats['items'] += 1
+                start = time.perf_counter()
+                if not self._put(output, item, stop):
+                    return
+                stats['blocked_s'] += time.perf_counter() - start
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            self._put(output, _DONE, stop)
+
+    def _stage(self, name, fn, inputQueue, output, stop, errors):
+        stats = self.stats[name]
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self._get(inputQueue, stop)
+                stats['starved_s'] += time.perf_counter() - start
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                with profiler.stage(name):
+                    item = fn(item)
+                stats['busy_s'] += time.perf_counter() - start
+                stats['items'] += 1
+                if output is not None and item is not None:
+                    start = time.perf_counter()
+                    if not self._put(output, item, stop):
+                        return
+                    stats['blocked_s'] += time.perf_counter() - start
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            if output is not None:
+                self._put(output, _DONE, stop)
+
+    def run(self):
+        """
+        Run every stage until the source is exhausted and the last item has
+        gone through the last stage
+
+        If a stage raises an exception, the other stages are stopped and the
+        exception is raised again here.
+
+        Returns
+        -------
+          - stats: A dictionary mapping each stage name to its number of
+            items, the time spent working (busy_s), waiting for input
+            (starved_s) and waiting for room in the next queue (blocked_s).
+            The stage with the most busy time sets the throughput
+        """
+        self.stats = {name: {'items': 0, 'busy_s': 0.0, 'starved_s': 0.0,
+                             'blocked_s': 0.0}
+                      for name, _ in self.stages}
+        stop = threading.Event()
+        errors = []
+        queues = [queue.Queue(self.maxQueue) for _ in self.stages[1:]]
+        (sourceName, items), rest = self.stages[0], self.stages[1:]
+        threads = [threading.Thread(
+            target=self._source, name=sourceName,
+            args=(sourceName, items, queues[0], stop, errors))]
+        for iStage, (name, fn) in enumerate(rest):
+            output = queues[iStage+1] if iStage+1 < len(queues) else None
+            threads.append(threading.Thread(
+                target=self._stage, name=name,
+                args=(name, fn, queues[iStage], output, stop, errors)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.1)
+        except BaseException:
+            stop.set()
+            raise
+        if errors:
+            raise errors[0]
+        return self.stats
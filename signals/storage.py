@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import numpy as np
+from sigmf import SigMFFile
+from signals.detail import detail
+from signals.emitter import emitter
+from signals.index import DatasetIndex
+from signals.profiling import profiler
+
+
+class SigMFWriter():
+    """
+    Write a SigMF recording incrementally, so the whole dataset never has to
+    be held in memory
+
+    Sample blocks are appended to the .sigmf-data file as they are produced.
+    Their annotations are spooled to a temporary file one JSON object per
+    line, and the .sigmf-meta file is assembled from the spool when the writer
+    is closed. Peak memory is set by the largest block passed to append(), not
+    by the size of the recording.
+
+    A columnar DatasetIndex of the vectors is written alongside the recording.
+    Since the index holds the labels and metadata of every vector, the JSON
+    annotations can be turned off for large datasets.
+
+    Parameters
+    ----------
+      - filename: Path of the recording, without the SigMF extension
+      - globalInfo: The SigMF global metadata dictionary
+      - annotations: If false, no per-vector annotations are written
+      - index: If true, a DatasetIndex is written next to the recording
+    """
+
+    def __init__(self, filename, globalInfo, annotations=True, index=True):
+        self.filename = filename
+        self.dataFilename = filename + '.sigmf-data'
+        self.metaFilename = filename + '.sigmf-meta'
+        self.spoolFilename = self.metaFilename + '.tmp'
+        self.globalInfo = dict(globalInfo)
+        self.globalInfo.setdefault(SigMFFile.DATATYPE_KEY, 'cf32_le')
+        self.annotations = annotations
+        self.nSampsWritten = 0
+        self.sha512 = hashlib.sha512()
+        self.dataFile = open(self.dataFilename, 'wb')
+        self.spoolFile = open(self.spoolFilename, 'w') if annotations else None
+        self.index = DatasetIndex() if index else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def append(self, data, metadata=None):
+        """
+        Append a block of equal-length vectors to the recording
+
+        Parameters
+        ----------
+          - data: An (N, nSamps) complex array with one vector per row
+          - metadata: The annotation metadata of the vectors. This is either
+            a single dictionary shared by every vector or a list with one
+            dictionary per vector
+
+        Returns
+        -------
+          - start: The sample index of the first vector in the block
+        """
+        data = np.atleast_2d(data).astype('<c8', copy=False)
+        nVecs, nSamps = data.shape
+        start = self.nSampsWritten
+        with profiler.stage('storage.data', nVecs=nVecs):
+            buffer = np.ascontiguousarray(data).data
+            self.dataFile.write(buffer)
+            self.sha512.update(buffer)
+        with profiler.stage('storage.index', nVecs=nVecs):
+            if isinstance(metadata, dict):
+                if self.index is not None:
+                    self._index_block(start, nVecs, nSamps, metadata)
+                metadata = [metadata]*nVecs
+            elif metadata is not None and self.index is not None:
+                for iVec, metaDict in enumerate(metadata):
+                    self._index_block(start + iVec*nSamps, 1, nSamps, metaDict)
+        if self.annotations and metadata is not None:
+            with profiler.stage('storage.annotations', nVecs=nVecs):
+                lines = []
+                for iVec, metaDict in enumerate(metadata):
+                    annotation = {
+                        SigMFFile.START_INDEX_KEY: start + iVec*nSamps,
+                        SigMFFile.LENGTH_INDEX_KEY: nSamps}
+                    annotation.update(metaDict)
+                    lines.append(json.dumps(annotation))
+                self.spoolFile.write('\n'.join(lines) + '\n')
+        self.nSampsWritten += nVecs*nSamps
+        return start
+
+    def _index_block(self, start, nVecs, nSamps, metaDict):
+        """
+        Add a block of vectors that share the same metadata to the index
+        """
+        self.index.append(start, nVecs, nSamps,
+                          metaDict.get(SigMFFile.LABEL_KEY, ''),
+                          metaDict.get(detail.DETAIL_KEY),
+                          metaDict.get(emitter.EMITTER_KEY))
+
+    def flush(self):
+        """
+        Flush the data and annotation files to disk
+        """
+        self.dataFile.flush()
+        if self.spoolFile is not None:
+            self.spoolFile.flush()
+
+    def close(self):
+        """
+        Finish the data file and assemble the .sigmf-meta file
+        """
+        if self.dataFile.closed:
+            return
+        self.dataFile.close()
+        if self.index is not None:
+            self.index.save(self.filename)
+        globalInfo = dict(self.globalInfo)
+        globalInfo[SigMFFile.HASH_KEY] = self.sha512.hexdigest()
+        captures = [{SigMFFile.START_INDEX_KEY: 0}]
+        with open(self.metaFilename, 'w') as metaFile:
+            metaFile.write('{"global": ' + json.dumps(globalInfo))
+            metaFile.write(', "captures": ' + json.dumps(captures))
+            metaFile.write(', "annotations": [')
+            if self.spoolFile is not None:
+                self.spoolFile.close()
+                with open(self.spoolFilename) as spoolFile:
+                    for iLine, line in enumerate(spoolFile):
+                        if iLine > 0:
+                            metaFile.write(', ')
+                        metaFile.write(line.rstrip('\n'))
+                os.remove(self.spoolFilename)
+            metaFile.write(']}')
@@ -0,0 +1,266 @@
+import multiprocessing as mp
+import pickle
+import queue
+import traceback
+import numpy as np
+from signals.channel import BatchChannel
+from signals.dataset import to_iq
+from signals.synthesis import DatasetSynthesizer
+from signals.waveform import LinearFMWaveform, SquareWaveform, bpsk, qpsk, \
+    psk8, qam16
+
+
+class BatchGenerator():
+    """
+    Synthesize labeled training batches with freshly drawn parameters
+
+    Every batch draws a noise voltage per waveform class and a new channel
+    (Doppler frequency and Rician K factor), then synthesizes an equal share
+    of the batch for each class with random bandwidths, pulsewidths and data.
+    The rows of the batch are shuffled before it is returned.
+
+    Parameters
+    ----------
+      - waveforms: The waveform classes to synthesize
+      - batchSize: Number of vectors per batch
+      - nSampsVec: Number of samples per vector
+      - sampRate: The sample rate of the waveforms (Hz)
+      - noiseVoltageRange: (min, max) noise voltage (dB)
+      - doppFreqRange: (min, max) maximum Doppler frequency of the channel (Hz)
+      - kFactorRange: (min, max) Rician K factor of the channel
+      - bandwidthRange: (min, max) bandwidth of the radar waveforms (Hz)
+      - pulsewidthRange: (min, max) pulsewidth of the radar waveforms (s)
+      - seed: The base seed of the generator
+    """
+
+    def __init__(self, waveforms=None, batchSize=1024, nSampsVec=128,
+                 sampRate=20e6, noiseVoltageRange=(-20, 20),
+                 doppFreqRange=(0.1, 10), kFactorRange=(1, 10),
+                 bandwidthRange=(1e6, 100e6), pulsewidthRange=(1e-6, 100e-6),
+                 seed=0):
+        if waveforms is None:
+            waveforms = [LinearFMWaveform, SquareWaveform,
+                         bpsk, qpsk, psk8, qam16]
+        self.waveforms = list(waveforms)
+        self.batchSize = batchSize
+        self.nSampsVec = nSampsVec
+        self.sampRate = sampRate
+        self.noiseVoltageRange = noiseVoltageRange
+        self.doppFreqRange = doppFreqRange
+        self.kFactorRange = kFactorRange
+        self.bandwidthRange = bandwidthRange
+        self.pulsewidthRange = pulsewidthRange
+        self.seed = seed
+        labels = [wave(bandwidth=bandwidthRange[0], pulsewidth=pulsewidthRange[0],
+                       sampRate=sampRate).label for wave in self.waveforms]
+        # Same class order as np.unique() over the labels of a stored dataset
+        self.classes = np.unique(labels)
+        self.labelIds = np.searchsorted(self.classes, labels)
+
+    def generate(self, batchId):
+        """
+        Synthesize one batch
+
+        Parameters
+        ----------
+          - batchId: Identifies the batch. The same id always gives the same
+            batch
+
+        Returns
+        -------
+          - x: A (batchSize, 2, nSampsVec) float32 array of I/Q frames
+          - y: A (batchSize, nClasses) float32 array of one-hot labels
+        """
+        rng = np.random.default_rng(
+            np.random.SeedSequence(self.seed, spawn_key=(batchId,)))
+        nWaves = len(self.waveforms)
+        voltages = 10**(rng.uniform(*self.noiseVoltageRange, nWaves)/20)
+        channel = BatchChannel(self.sampRate, 0.01, 50, .01, 0.5e3, 8,
+                               rng.uniform(*self.doppFreqRange), True,
+                               rng.uniform(*self.kFactorRange),
+                               [0.0, 0.9, 1.3], [1, 0.99, 0.97], 8)
+        # Split the batch as evenly as possible between the classes
+        nPerWave = np.full((nWaves,), self.batchSize // nWaves)
+        nPerWave[:self.batchSize % nWaves] += 1
+        synthesizer = DatasetSynthesizer(
+            waveforms=self.waveforms, noiseVoltages=voltages,
+            nVecClass=int(nPerWave.max()), nSampsVec=self.nSampsVec,
+            sampRate=self.sampRate, channel=channel,
+            bandwidthRange=self.bandwidthRange,
+            pulsewidthRange=self.pulsewidthRange,
+            seed=int(rng.integers(2**63)))
+        samples = []
+        labelIds = []
+        for iWave in range(nWaves):
+            data, _ = synthesizer.synthesize_shard(
+                (iWave, iWave, 0, int(nPerWave[iWave])))
+            samples.append(data)
+            labelIds.append(np.full((len(data),), self.labelIds[iWave]))
+        order = rng.permutation(self.batchSize)
+        x = to_iq(np.concatenate(samples)[order])
+        y = np.eye(len(self.classes), dtype=np.float32)[
+            np.concatenate(labelIds)[order]]
+        return x, y
+
+
+class _WorkerError():
+    """
+    An exception raised in a worker process, sent to the consumer in place of
+    a batch
+
+    Parameters
+    ----------
+      - workerId: The worker that raised the exception
+      - error: The exception. Exceptions that can not be pickled are
+        replaced by a RuntimeError with their description
+      - trace: The formatted traceback of the exception in the worker
+    """
+
+    def __init__(self, workerId, error, trace):
+        try:
+            pickle.dumps(error)
+        except Exception:
+            error = RuntimeError(repr(error))
+        self.workerId = workerId
+        self.error = error
+        self.trace = trace
+
+
+def _put(batches, item, stop):
+    """
+    Put an item on the queue, giving up if the stream is stopped
+    """
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def _produce(generator, workerId, nWorkers, batches, stop):
+    """
+    Worker process loop: synthesize batches workerId, workerId + nWorkers, ...
+    until the stream is stopped. An exception ends the worker and is sent to
+    the consumer
+    """
+    batchId = workerId
+    try:
+        while not stop.is_set():
+            _put(batches, generator.generate(batchId), stop)
+            batchId += nWorkers
+    except BaseException as e:
+        _put(batches, _WorkerError(workerId, e, traceback.format_exc()), stop)
+
+
+class SyntheticStream():
+    """
+    An endless stream of synthetic training batches produced by background
+    worker processes
+
+    Workers put finished batches in a bounded queue, so at most queueSize
+    batches are buffered ahead of training. Iterating over the stream yields
+    (x, y) batches from BatchGenerator.generate(). Batches arrive in the order
+    the workers finish them, so the stream is not deterministic across runs
+    even though every batch is. If a worker raises an exception or dies, the
+    stream is stopped and the error is raised by the iterator, instead of
+    waiting forever for a batch.
+
+    Parameters
+    ----------
+      - generator: The BatchGenerator used by the workers
+      - nWorkers: Number of worker processes. If None, one per CPU
+      - queueSize: Maximum number of finished batches waiting to be consumed
+      - startMethod: The multiprocessing start method. Workers are spawned by
+        default because forking a process that has initialized TensorFlow
+        can deadlock
+    """
+
+    def __init__(self, generator, nWorkers=None, queueSize=8,
+                 startMethod='spawn'):
+        self.generator = generator
+        self.nWorkers = nWorkers or mp.cpu_count()
+        self.queueSize = queueSize
+        self.context = mp.get_context(startMethod)
+        self.batches = None
+        self.stopEvent = None
+        self.workers = []
+
+    def start(self):
+        """
+        Start the worker processes
+        """
+        if self.workers:
+            return
+        self.batches = self.context.Queue(maxsize=self.queueSize)
+        self.stopEvent = self.context.Event()
+        self.workers = [
+            self.context.Process(target=_produce,
+                                 args=(self.generator, workerId, self.nWorkers,
+                                       self.batches, self.stopEvent),
+                                 daemon=True)
+            for workerId in range(self.nWorkers)]
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        """
+        Stop the worker processes
+        """
+        if not self.workers:
+            return
+        self.stopEvent.set()
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+        self.batches.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+    def _check_workers(self):
+        """
+        Raise an error if a worker process has exited. Workers only exit on
+        their own when they are killed, e.g. by the out-of-memory killer
+        """
+        for workerId, worker in enumerate(self.workers):
+            if worker.exitcode is not None:
+                exitcode = worker.exitcode
+                self.stop()
+                raise RuntimeError(
+                    f'Worker {workerId} exited with code {exitcode}')
+
+    def __iter__(self):
+        self.start()
+        while True:
+            try:
+                batch = self.batches.get(timeout=1)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if isinstance(batch, _WorkerError):
+                self.stop()
+                raise batch.error from RuntimeError(
+                    f'Traceback of worker {batch.workerId}:\n{batch.trace}')
+            yield batch
+
+    def as_tf_dataset(self):
+        """
+        Wrap the stream in a tf.data.Dataset that can be passed to model.fit
+        together with steps_per_epoch
+        """
+        import tensorflow as tf
+        nSamps = self.generator.nSampsVec
+        nClasses = len(self.generator.classes)
+        return tf.data.Dataset.from_generator(
+            self.__iter__,
+            output_signature=(
+                tf.TensorSpec(shape=(None, 2, nSamps), dtype=tf.float32),
+                tf.TensorSpec(shape=(None, nClasses), dtype=tf.float32))
+        ).prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,378 @@
+import datetime as dt
+import hashlib
+import importlib
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import sigmf
+from sigmf import SigMFFile
+from signals.channel import BatchChannel
+from signals.precision import normalize_energy
+from signals.profiling import profiler
+from signals.storage import SigMFWriter
+from signals.waveform import RadarWaveform, LinearFMWaveform, SquareWaveform, \
+    bpsk, qpsk, psk8, qam16
+
+# Modules whose source determines the synthesized samples
+SOURCE_MODULES = ('signals.waveform', 'signals.modulator',
+                  'signals.constellation', 'signals.channel',
+                  'signals.precision', 'signals.synthesis')
+_codeVersion = None
+
+
+def code_version():
+    """
+    Return a hash of the source of the modules that synthesize samples, so
+    cached shards are invalidated whenever the synthesis code changes
+    """
+    global _codeVersion
+    if _codeVersion is None:
+        sha = hashlib.sha256(np.__version__.encode())
+        for name in SOURCE_MODULES:
+            with open(importlib.import_module(name).__file__, 'rb') as source:
+                sha.update(source.read())
+        _codeVersion = sha.hexdigest()
+    return _codeVersion
+
+
+def _hash_int(value):
+    """
+    Map a value to a stable 64-bit integer
+    """
+    digest = hashlib.sha256(repr(value).encode()).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def _parameters(obj):
+    """
+    Return the scalar and array attributes of an object as a JSON-serializable
+    dictionary
+    """
+    params = {'class': type(obj).__module__ + '.' + type(obj).__qualname__}
+    for name, value in sorted(vars(obj).items()):
+        if isinstance(value, (bool, int, float, str, np.number)):
+            params[name] = value.item() if isinstance(value, np.number) else value
+        elif isinstance(value, np.ndarray):
+            params[name] = value.tolist()
+    return params
+
+
+class DatasetSynthesizer():
+    """
+    Synthesize a labeled dataset of impaired waveform vectors
+
+    The (noise voltage x waveform class) grid is split into shards of at most
+    shardSize vectors. Every vector draws its parameters, data and channel
+    realization from generators seeded by (seed, noise voltage, waveform
+    class, iVec), so the output does not depend on the shard size, on how the
+    shards are distributed over worker processes, or on where the noise
+    voltage and waveform are in the grid. Adding a point to the grid leaves
+    the vectors of the other points unchanged, which lets run() reuse shards
+    from a ShardCache.
+
+    Parameters
+    ----------
+      - waveforms: The waveform classes to synthesize
+      - noiseVoltages: The noise voltages to simulate
+      - nVecClass: Number of vectors per (noise voltage, waveform) pair
+      - nSampsVec: Number of samples per vector
+      - sampRate: The sample rate of the waveforms (Hz)
+      - channel: The BatchChannel applied to every vector. If None, the
+        channel used in the synthesis notebook is used
+      - bandwidthRange: (min, max) bandwidth of the radar waveforms (Hz)
+      - pulsewidthRange: (min, max) pulsewidth of the radar waveforms (s)
+      - nSampsSource: Number of fully pulse shaped samples generated per
+        communications vector, after the filter transient. The vector is a
+        random window of these
+      - seed: The base seed of the dataset
+      - shardSize: Maximum number of vectors per shard. Memory use scales
+        with this rather than with nVecClass
+    """
+
+    def __init__(self, waveforms=None, noiseVoltages=None, nVecClass=500,
+                 nSampsVec=128, sampRate=20e6, channel=None,
+                 bandwidthRange=(1e6, 100e6), pulsewidthRange=(1e-6, 100e-6),
+                 nSampsSource=1024, seed=0, shardSize=1000):
+        if waveforms is None:
+            waveforms = [LinearFMWaveform, SquareWaveform,
+                         bpsk, qpsk, psk8, qam16]
+        if noiseVoltages is None:
+            noiseVoltages = np.append(
+                np.zeros(1,), 10**(np.linspace(-20, 20, 10)/20))
+        if channel is None:
+            channel = BatchChannel(sampRate, 0.01, 50, .01, 0.5e3, 8, 1, True,
+                                   4, [0.0, 0.9, 1.3], [1, 0.99, 0.97], 8)
+        self.waveforms = list(waveforms)
+        self.noiseVoltages = np.asarray(noiseVoltages, dtype=np.float64)
+        self.nVecClass = nVecClass
+        self.nSampsVec = nSampsVec
+        self.sampRate = sampRate
+        self.channel = channel
+        self.bandwidthRange = bandwidthRange
+        self.pulsewidthRange = pulsewidthRange
+        self.nSampsSource = nSampsSource
+        self.seed = seed
+        self.shardSize = shardSize
+
+    def shards(self):
+        """
+        Return the (iVoltage, iWave, startVec, stopVec) index of every shard,
+        in dataset order
+        """
+        return [(iVoltage, iWave, start, min(start+self.shardSize, self.nVecClass))
+                for iVoltage in range(len(self.noiseVoltages))
+                for iWave in range(len(self.waveforms))
+                for start in range(0, self.nVecClass, self.shardSize)]
+
+    def _waveform(self, iWave):
+        """
+        Create the waveform object of a waveform class
+        """
+        return self.waveforms[iWave](
+            bandwidth=self.bandwidthRange[0], pulsewidth=self.pulsewidthRange[0],
+            sampRate=self.sampRate)
+
+    def _row_seeds(self, shard, stream):
+        """
+        Return one SeedSequence per vector of a shard. Different streams give
+        independent seeds for the same vector
+        """
+        iVoltage, iWave, start, stop = shard
+        wave = self.waveforms[iWave]
+        voltageId = _hash_int(float(self.noiseVoltages[iVoltage]))
+        waveId = _hash_int(getattr(wave, '__module__', '') + '.' +
+                           getattr(wave, '__qualname__', repr(wave)))
+        return [np.random.SeedSequence(self.seed,
+                                       spawn_key=(voltageId, waveId, iVec, stream))
+                for iVec in range(start, stop)]
+
+    def shard_key(self, shard):
+        """
+        Return the content hash of a shard
+
+        The key covers the waveform class and parameters, the channel
+        parameters, the noise voltage, the seed, the vectors in the shard and
+        the version of the synthesis code, so two shards with the same key
+        hold the same samples.
+
+        Parameters
+        ----------
+          - shard: The (iVoltage, iWave, startVec, stopVec) index of the
+            shard
+        """
+        iVoltage, iWave, start, stop = shard
+        description = {
+            'code': code_version(),
+            'seed': self.seed,
+            'waveform': _parameters(self._waveform(iWave)),
+            'channel': _parameters(self.channel),
+            'noiseVoltage': float(self.noiseVoltages[iVoltage]),
+            'nSampsVec': self.nSampsVec,
+            'sampRate': self.sampRate,
+            'bandwidthRange': list(self.bandwidthRange),
+            'pulsewidthRange': list(self.pulsewidthRange),
+            'nSampsSource': self.nSampsSource,
+            'vectors': [start, stop],
+        }
+        return hashlib.sha256(
+            json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def missing_shards(self, cache):
+        """
+        Return the shards that are not in a ShardCache yet
+        """
+        return [shard for shard in self.shards()
+                if self.shard_key(shard) not in cache]
+
+    def _source(self, sig, rngs):
+        """
+        Generate the undistorted signal of every vector in a shard
+
+        Returns
+        -------
+          - data: An (nVecs, nSamps) complex64 array of signals
+          - lengths: The number of valid samples in each row
+          - firsts: The first sample of each row a window can start at.
+            Communications rows start with the transient of the pulse
+            shaping filter, which the GNU Radio transmitter skips as well
+        """
+        if isinstance(sig, RadarWaveform):
+            params = np.array([
+                [rng.uniform(*self.bandwidthRange),
+                 rng.uniform(*self.pulsewidthRange)] for rng in rngs])
+            nSamps = int(np.ceil(self.pulsewidthRange[1]*self.sampRate))
+            data = type(sig).sample_batch(
+                params[:, 0], params[:, 1], nSamps, self.sampRate)
+            lengths = np.minimum(
+                np.round(params[:, 1]*self.sampRate).astype(np.intp), nSamps)
+            firsts = np.zeros((len(rngs),), dtype=np.intp)
+        else:
+            modulator = sig.modulator()
+            # nSampsSource fully pulse shaped samples after the transient
+            nSamps = modulator.transient + self.nSampsSource
+            nBytes = modulator.bytes_required(nSamps)
+            bits = np.stack([rng.integers(0, 256, nBytes, dtype=np.uint8)
+                             for rng in rngs])
+            data = modulator.sample_batch(len(rngs), nSamps, data=bits)
+            lengths = np.full((len(rngs),), nSamps)
+            firsts = np.full((len(rngs),), modulator.transient)
+        return data, lengths, firsts
+
+    def _windows(self, data, lengths, firsts, rngs):
+        """
+        Cut a random window of nSampsVec samples from each row, starting at
+        or after the first valid sample of the row and preceded by enough
+        samples to fill the multipath filter of the channel
+        """
+        nPrefix = self.channel.nTapsMultipath - 1
+        nWindow = nPrefix + self.nSampsVec
+        maxStart = np.maximum(lengths, firsts + self.nSampsVec) - self.nSampsVec
+        starts = np.array([rng.integers(firsts[i], maxStart[i], endpoint=True)
+                           for i, rng in enumerate(rngs)])
+        nPadded = nPrefix + max(data.shape[1], firsts.max() + self.nSampsVec)
+        padded = np.zeros((data.shape[0], nPadded), dtype=np.complex64)
+        padded[:, nPrefix:nPrefix+data.shape[1]] = data
+        index = starts[:, np.newaxis] + np.arange(nWindow)
+        return np.take_along_axis(padded, index, axis=1)
+
+    def synthesize_shard(self, shard):
+        """
+        Synthesize every vector of a single shard
+
+        Parameters
+        ----------
+          - shard: The (iVoltage, iWave, startVec, stopVec) index of the
+            shard
+
+        Returns
+        -------
+          - data: An (nVecs, nSampsVec) complex64 array of energy normalized
+            vectors
+          - metadata: The SigMF annotation metadata shared by every vector
+        """
+        iVoltage, iWave = shard[:2]
+        voltage = self.noiseVoltages[iVoltage]
+        sig = self._waveform(iWave)
+        rngs = [np.random.default_rng(seq)
+                for seq in self._row_seeds(shard, 0)]
+        with profiler.stage('synthesis.source', label=sig.label):
+            data, lengths, firsts = self._source(sig, rngs)
+        with profiler.stage('synthesis.window'):
+            data = self._windows(data, lengths, firsts, rngs)
+        with profiler.stage('synthesis.channel'):
+            data = self.channel.apply(
+                data, voltage, self._row_seeds(shard, 1))
+        data = data[:, self.channel.nTapsMultipath-1:]
+        # Normalize the energy to stay consistent with different modulations
+        with profiler.stage('synthesis.normalize'):
+            normalize_energy(data)
+        with profiler.stage('synthesis.metadata'):
+            with np.errstate(divide='ignore'):
+                sig.detail.noise_voltage = str(20*np.log10(voltage))
+            metadata = {SigMFFile.LABEL_KEY: sig.label,
+                        sig.DETAIL_KEY: dict(sig.detail.dict())}
+        return data, metadata
+
+    def _profiled_shard(self, shard):
+        """
+        Synthesize a shard in a worker process with profiling enabled, and
+        return the recorded stages along with it
+        """
+        # Forked workers inherit the stages the parent recorded before the
+        # pool started. Discard them so they are not merged back once per
+        # worker
+        profiler.reset()
+        profiler.enable()
+        with profiler.stage('synthesis.shard', shard=list(shard)):
+            data, metadata = self.synthesize_shard(shard)
+        return data, metadata, profiler.drain()
+
+    def global_info(self, author=None, description=None):
+        """
+        Return the SigMF global metadata of the dataset
+
+        Parameters
+        ----------
+          - author: The author stored in the SigMF global metadata
+          - description: The description stored in the SigMF global metadata
+        """
+        globalInfo = {
+            SigMFFile.DATATYPE_KEY: 'cf32_le',
+            SigMFFile.SAMPLE_RATE_KEY: self.sampRate,
+            SigMFFile.DESCRIPTION_KEY: description or 'Synthetic RF dataset for machine learning',
+            SigMFFile.VERSION_KEY: sigmf.__version__,
+        }
+        if author is not None:
+            globalInfo[SigMFFile.AUTHOR_KEY] = author
+        return globalInfo
+
+    def run(self, filename, nWorkers=None, author=None, description=None,
+            annotations=True, cache=None):
+        """
+        Synthesize the whole dataset and stream it to a SigMF recording
+
+        Shards are written in dataset order as soon as they are done. At most
+        two shards per worker are in flight at once, so memory use does not
+        grow with the size of the dataset. With a cache, only the shards that
+        are not cached yet are synthesized, and the recording is assembled
+        from the cached and the new shards.
+
+        Parameters
+        ----------
+          - filename: Path of the recording, without the SigMF extension
+          - nWorkers: Number of worker processes. If None, one worker per CPU
+          - author: The author stored in the SigMF global metadata
+          - description: The description stored in the SigMF global metadata
+          - annotations: If false, only the columnar DatasetIndex describes
+            the vectors and no per-vector JSON annotations are written
+          - cache: A ShardCache to read shards from and store new shards in
+        """
+        if nWorkers is None:
+            nWorkers = os.cpu_count() or 1
+        maxPending = 2*nWorkers
+        writer = SigMFWriter(filename, self.global_info(author, description),
+                             annotations=annotations)
+        # Stages recorded by the workers are merged into this profiler
+        synthesize = self._profiled_shard if profiler.enabled else \
+            self.synthesize_shard
+        with writer, ProcessPoolExecutor(max_workers=nWorkers) as executor:
+            # (key, future) pairs in dataset order. Cached shards have no
+            # future
+            pending = deque()
+            for shard in self.shards():
+                key = self.shard_key(shard) if cache is not None else None
+                if key is not None and key in cache:
+                    pending.append((key, None))
+                else:
+                    pending.append((key, executor.submit(synthesize, shard)))
+                if len(pending) >= maxPending:
+                    self._write_shard(writer, cache, *pending.popleft())
+            while pending:
+                self._write_shard(writer, cache, *pending.popleft())
+
+    @staticmethod
+    def _write_shard(writer, cache, key, future):
+        """
+        Append a cached or synthesized shard to the recording, storing newly
+        synthesized shards in the cache
+        """
+        if future is None:
+            with profiler.stage('synthesis.cache_load'):
+                data, metadata = cache.get(key)
+        else:
+            data, metadata, *profile = future.result()
+            if profile:
+                profiler.merge(*profile[0])
+            if cache is not None:
+                with profiler.stage('synthesis.cache_store'):
+                    cache.put(key, data, metadata)
+        metaDict = dict(metadata)
+        metaDict[SigMFFile.DATETIME_KEY] = dt.datetime.utcnow().isoformat()+'Z'
+        with profiler.stage('synthesis.write'):
+            writer.append(data, metaDict)
+
+
+if __name__ == '__main__':
+    DatasetSynthesizer(nVecClass=10).run('dataset')
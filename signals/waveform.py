@@ -1,7 +1,11 @@
 import numpy as np
 from abc import abstractmethod
-from gnuradio import gr, blocks, analog, digital
+from gnuradio import gr, blocks, analog
+from signals.cache import sampleCache, transmitterCache
+from signals.constellation import registry
 from signals.detail import detail
+from signals.precision import COMPLEX_DTYPE, phasor
+from signals.profiling import profiler
 
 ###############################################################################
 # Radar Waveforms
@@ -27,7 +31,7 @@ class RadarTransmitter(gr.hier_block2):
                                 gr.io_signature(0, 0, 0),
                                 gr.io_signature(1, 1, gr.sizeof_gr_complex))
         # Data samples to transmit
-        self.data = waveform.sample()
+        self.data = waveform.cached_sample()
         self.repeat = repeat
         self.src = blocks.vector_source_c(self.data, repeat)
         if nSamps is None:
@@ -57,6 +61,25 @@ class RadarTransmitter(gr.hier_block2):
         if self.head is not None:
             self.head.reset()
 
+    def nbytes(self):
+        """
+        Return the memory held by the blocks of the transmitter. The vector
+        source keeps its own copy of the samples, so that copy is counted.
+        The NumPy samples in self.data are shared with the sample cache and
+        are not
+        """
+        return len(self.data)*gr.sizeof_gr_complex
+
+    def counted_blocks(self):
+        """
+        Return the (name, block) pairs of the blocks in the transmitter, for
+        profiler.record_blocks()
+        """
+        named = [('transmitter.source', self.src)]
+        if self.head is not None:
+            named.append(('transmitter.head', self.head))
+        return named
+
 
 class RadarWaveform():
     """
@@ -82,16 +105,62 @@ class RadarWaveform():
         """
         pass
 
-    def transmitter(self, **kwargs):
+    @classmethod
+    @ abstractmethod
+    def sample_batch(cls, bandwidths, pulsewidths, nSamps, sampRate):
+        """
+        Generate one sampled waveform per (bandwidth, pulsewidth) pair
+
+        Parameters
+        ----------
+          - bandwidths: Bandwidth of each waveform (Hz)
+          - pulsewidths: Time duration of each waveform (s)
+          - nSamps: The number of samples in each output row
+          - sampRate: The sample rate of the waveforms (Hz)
+        """
+        pass
+
+    def cache_key(self):
+        """
+        Return a hashable key identifying the samples of this waveform
+        """
+        return (type(self).__name__, getattr(self, 'bandwidth', None),
+                self.pulsewidth, self.sampRate)
+
+    @profiler.profiled('waveform.cached_sample')
+    def cached_sample(self):
+        """
+        Return a read-only sampled version of this waveform, reusing the
+        samples from the process-wide sample cache when a waveform with the
+        same parameters has already been sampled
+        """
+        return sampleCache.get(self.cache_key(), self.sample)
+
+    def transmitter(self, cached=False, **kwargs):
         """
         Return a RadarTransmitter object that will transmit this waveform
 
         Parameters:
         -----------
+          - cached: If true, reuse a transmitter block built earlier for a
+            waveform with the same parameters. Its head block is reset and
+            its data restored before it is returned. A cached transmitter can
+            only be connected to one flowgraph at a time
           - name: A string giving the name of the transmitter block
           - nSamps: The number of samples to transmit
         """
-        return RadarTransmitter(self, **kwargs)
+        if not cached:
+            return RadarTransmitter(self, **kwargs)
+        key = self.cache_key() + tuple(sorted(kwargs.items()))
+        # Only the transmitter's own copy of the samples is charged. The
+        # samples in tx.data are charged to the sample cache
+        tx = transmitterCache.get(
+            key, lambda: RadarTransmitter(self, **kwargs),
+            nBytes=RadarTransmitter.nbytes)
+        if tx.data is not self.cached_sample():
+            tx.set_data(self.cached_sample())
+        tx.reset()
+        return tx
 
 
 class LinearFMWaveform(RadarWaveform):
@@ -117,14 +186,46 @@ class LinearFMWaveform(RadarWaveform):
         self.pulsewidth = pulsewidth
         self.sampRate = sampRate
 
+    @profiler.profiled('waveform.sample')
     def sample(self):
-        data = np.zeros((round(self.sampRate*self.pulsewidth)),
-                        dtype=np.complex64)
         Ts = 1 / self.sampRate
         t = np.arange(0, self.pulsewidth-Ts, Ts)
         phase = -self.bandwidth/2*t + self.bandwidth / \
             (2*self.pulsewidth)*(t**2)
-        data = np.exp(1j*phase)
+        return phasor(phase)
+
+    @classmethod
+    @profiler.profiled('waveform.sample_batch')
+    def sample_batch(cls, bandwidths, pulsewidths, nSamps, sampRate):
+        """
+        Generate a batch of LFM pulses in a single vectorized call
+
+        Each row uses the same sample grid as sample(). Pulses shorter than
+        nSamps are zero-padded and pulses longer than nSamps are truncated to
+        the first nSamps samples.
+
+        Parameters
+        ----------
+          - bandwidths: Sweep bandwidth of each pulse (Hz)
+          - pulsewidths: Time duration of each pulse (s)
+          - nSamps: The number of samples in each output row
+          - sampRate: The sample rate of the waveforms (Hz)
+
+        Returns
+        -------
+          - data: An (N, nSamps) complex64 array with one pulse per row
+        """
+        bandwidths, pulsewidths = np.broadcast_arrays(
+            np.asarray(bandwidths, dtype=np.float64).ravel(),
+            np.asarray(pulsewidths, dtype=np.float64).ravel())
+        Ts = 1 / sampRate
+        t = np.arange(nSamps)*Ts
+        # Same pulse length as np.arange(0, pulsewidth-Ts, Ts) in sample()
+        lengths = np.ceil((pulsewidths - Ts) / Ts)
+        phase = -bandwidths[:, np.newaxis]/2*t + \
+            (bandwidths/(2*pulsewidths))[:, np.newaxis]*(t**2)
+        data = phasor(phase)
+        data[np.arange(nSamps) >= lengths[:, np.newaxis]] = 0
         return data
 
 
@@ -149,9 +250,37 @@ class SquareWaveform(RadarWaveform):
         self.sampRate = sampRate
         self.bandwidth = 1 / self.pulsewidth
 
+    @profiler.profiled('waveform.sample')
     def sample(self):
         nSamps = round(self.sampRate*self.pulsewidth)
-        return np.ones((nSamps,), dtype=np.complex64)
+        return np.ones((nSamps,), dtype=COMPLEX_DTYPE)
+
+    @classmethod
+    @profiler.profiled('waveform.sample_batch')
+    def sample_batch(cls, bandwidths, pulsewidths, nSamps, sampRate):
+        """
+        Generate a batch of square pulses in a single vectorized call
+
+        Pulses shorter than nSamps are zero-padded and pulses longer than
+        nSamps are truncated to the first nSamps samples.
+
+        Parameters
+        ----------
+          - bandwidths: Unused, accepted so every radar waveform shares the
+            same batch signature
+          - pulsewidths: Time duration of each pulse (s)
+          - nSamps: The number of samples in each output row
+          - sampRate: The sample rate of the waveforms (Hz)
+
+        Returns
+        -------
+          - data: An (N, nSamps) complex64 array with one pulse per row
+        """
+        pulsewidths = np.asarray(pulsewidths, dtype=np.float64).ravel()
+        lengths = np.round(sampRate*pulsewidths)
+        data = np.zeros((len(pulsewidths), nSamps), dtype=COMPLEX_DTYPE)
+        data[np.arange(nSamps) < lengths[:, np.newaxis]] = 1
+        return data
 
 ###############################################################################
 # Communications waveforms
@@ -163,44 +292,98 @@ class CommunicationsTransmitter(gr.hier_block2):
     A class used for propagating communications signals through a Python-based
     GNU Radio flowgraph
 
+    Each run modulates only the data needed for a window of nSamps samples.
+    The output starts with nLead samples that should be discarded: the
+    transient of the root-raised cosine filter, nTransient samples for the
+    filters downstream of the transmitter to settle, and the window offset.
+
     Parameters:
     -----------
         - waveform: The CommunicationsWaveform object to transmit
         - src: The data bits to modulate
         - repeat: If true, repeats the waveform until the flowgraph is stopped
         - name: The name of the transmitter object
+        - shared: If true, use the modulator block shared by every waveform
+          with the same parameters instead of building a new one. Only one
+          flowgraph can use a shared modulator at a time
+        - nSamps: The number of samples in the window
+        - offset: The start of the window, counted from the first fully
+          pulse shaped sample
+        - nTransient: Extra samples in front of the window for downstream
+          filters (e.g. the channel) to settle. If None, the transient of
+          channel is used
+        - channel: The Channel the transmitter feeds, if any. Used to derive
+          nTransient. For a channels.dynamic_channel_model, pass
+          nTransient=settling_samples(nTapsMultipath) instead
+        - seed: The seed of the random data source. Transmitters that run
+          concurrently need different seeds to send different data
     """
 
-    def __init__(self, waveform, src=None, repeat=False, name='CommunicationsTransmitter', **kwargs):
+    def __init__(self, waveform, src=None, repeat=False, name='CommunicationsTransmitter', shared=False,
+                 nSamps=8192, offset=0, nTransient=None, channel=None, seed=0,
+                 **kwargs):
         gr.hier_block2.__init__(self, name,
                                 gr.io_signature(0, 0, 0),
                                 gr.io_signature(1, 1, gr.sizeof_gr_complex))
         if src is None:
             # Modulate random bits
-            self.data = analog.random_uniform_source_b(0, 256, 0)
+            self.data = analog.random_uniform_source_b(0, 256, seed)
         else:
             # Use a user-defined source block
             self.data = src
         # Create a modulator object from the waveform constellation
-        self.modulator = digital.generic_mod(
-            constellation=waveform.constellation,
-            differential=waveform.differential,
-            samples_per_symbol=waveform.sampsPerSym,
-            pre_diff_code=True,
-            excess_bw=waveform.excessBandwidth,
-            verbose=False,
-            log=False,
-            truncate=False)
-        # TODO: This should be based on the object parameters
-        self.head = blocks.head(gr.sizeof_gr_complex, 8192)
-        self.connect(self.data, self.modulator, self.head, self)
-
-    def reset(self):
+        self.modulator = registry.modulator(waveform, shared=shared)
+        # The NumPy modulator has the same filter, so it is used to work out
+        # how much data each run needs
+        self.numpyModulator = registry.numpy_modulator(waveform)
+        self.nSamps = nSamps
+        if nTransient is None:
+            nTransient = channel.transient if channel is not None else 0
+        self.nTransient = nTransient
+        self.byteHead = blocks.head(gr.sizeof_char, 1)
+        self.head = blocks.head(gr.sizeof_gr_complex, 1)
+        self.reset(offset)
+        self.connect(self.data, self.byteHead, self.modulator, self.head, self)
+
+    def reset(self, offset=None):
         """
-        Reset the counter on the internal head block
+        Reset the counters on the internal head blocks
+
+        Parameters
+        ----------
+          - offset: The start of the window for the next run. If None, the
+            previous offset is reused
         """
+        if offset is not None:
+            self.offset = int(offset)
+            modulator = self.numpyModulator
+            nOut = modulator.samples_required(
+                self.nSamps, self.offset, self.nTransient)
+            self.nLead = nOut - self.nSamps
+            # The resampler holds back its last tapsPerFilter-1 symbols when
+            # the data stream ends, so send a filter's worth of extra symbols
+            self.byteHead.set_length(modulator.bytes_required(
+                nOut + modulator.tapsPerFilter*modulator.sampsPerSym))
+            self.head.set_length(nOut)
+        self.byteHead.reset()
         self.head.reset()
 
+    def counted_blocks(self):
+        """
+        Return the (name, block) pairs of the blocks in the transmitter, for
+        profiler.record_blocks()
+        """
+        named = [('transmitter.source', self.data),
+                 ('transmitter.byte_head', self.byteHead),
+                 ('transmitter.head', self.head)]
+        # The modulator is a hierarchical block, so report its children
+        for name in ('bytes2chunks', 'symbol_mapper', 'diffenc',
+                     'chunks2symbols', 'rrc_filter'):
+            if hasattr(self.modulator, name):
+                named.append(('transmitter.' + name,
+                              getattr(self.modulator, name)))
+        return named
+
 
 class CommunicationsWaveform():
     """
@@ -227,6 +410,32 @@ class CommunicationsWaveform():
         """
         return CommunicationsTransmitter(self, **kwargs)
 
+    def modulator(self):
+        """
+        Return the shared NumpyModulator with the same parameters as the GNU
+        Radio modulator used by this waveform's transmitter
+        """
+        return registry.numpy_modulator(self)
+
+    @profiler.profiled('waveform.sample_batch')
+    def sample_batch(self, nVecs, nSamps, data=None, seed=None):
+        """
+        Generate a batch of modulated vectors without running a flowgraph
+
+        Parameters
+        ----------
+          - nVecs: The number of vectors to generate
+          - nSamps: The number of samples in each vector
+          - data: An (nVecs, nBytes) uint8 array of data bytes to modulate.
+            If None, uniformly random bytes are drawn
+          - seed: The seed used to draw random bytes
+
+        Returns
+        -------
+          - data: An (nVecs, nSamps) complex64 array
+        """
+        return self.modulator().sample_batch(nVecs, nSamps, data=data, seed=seed)
+
 
 class psk(CommunicationsWaveform):
     """
@@ -244,9 +453,7 @@ class psk(CommunicationsWaveform):
         self.detail.modulation = "psk"
         self.detail.order = order
         self.label = str(order) + 'PSK'
-        # TODO: I need a smarter way to handle constellation definitions
-        if order == 8:
-            self.constellation = digital.constellation_8psk()
+        self.constellation = registry.constellation("psk", order)
 
 
 class bpsk(psk):
@@ -257,7 +464,6 @@ class bpsk(psk):
     def __init__(self, **kwargs):
         psk.__init__(self, order=2, **kwargs)
         self.label = "BPSK"
-        self.constellation = digital.constellation_bpsk()
 
 
 class psk8(psk):
@@ -268,7 +474,6 @@ class psk8(psk):
     def __init__(self, **kwargs):
         psk.__init__(self, order=8, **kwargs)
         self.label = "8PSK"
-        self.constellation = digital.constellation_8psk()
 
 
 class qpsk(CommunicationsWaveform):
@@ -278,7 +483,6 @@ class qpsk(CommunicationsWaveform):
         """
         psk.__init__(self, order=4, **kwargs)
         self.label = "QPSK"
-        self.constellation = digital.constellation_qpsk()
 
 
 class qam(CommunicationsWaveform):
@@ -296,6 +500,8 @@ class qam(CommunicationsWaveform):
         self.detail.type = "digital"
         self.detail.modulation = "qam"
         self.detail.order = order
+        self.label = str(order) + 'QAM'
+        self.constellation = registry.constellation("qam", order)
 
 
 class qam16(qam):
@@ -306,4 +512,106 @@ class qam16(qam):
     def __init__(self, **kwargs):
         qam.__init__(self, order=16, **kwargs)
         self.label = "16QAM"
-        self.constellation = digital.constellation_16qam()
+
+###############################################################################
+# Capture
+###############################################################################
+
+
+class WindowSink(gr.sync_block):
+    """
+    A sink that keeps only a window of nSamps samples from the stream it
+    consumes, starting at a random offset drawn when the sink is reset. The
+    window is stored in a preallocated buffer that is reused across runs, so
+    the cost of a capture does not grow with the number of runs. Once the
+    window is full the sink tells the scheduler it is done, which stops the
+    flowgraph without processing the rest of the stream.
+
+    WindowSink is a Python block, so every call of its work() takes the GIL.
+    Flowgraphs that run concurrently from threads should end in a native
+    blocks.vector_sink_c instead, and cut the window out of its samples
+    with cut_window().
+
+    Parameters
+    ----------
+      - nSamps: The number of samples in the captured window
+      - maxOffset: The largest window start offset (in samples) that can be
+        drawn. The offset is drawn uniformly from [0, maxOffset]
+      - seed: The seed used to draw window offsets
+      - name: The name of the sink block
+    """
+
+    def __init__(self, nSamps, maxOffset=0, seed=None, name='WindowSink'):
+        gr.sync_block.__init__(self, name=name,
+                               in_sig=[np.complex64],
+                               out_sig=None)
+        self.nSamps = nSamps
+        self.rng = np.random.default_rng(seed)
+        self.buffer = np.zeros((nSamps,), dtype=np.complex64)
+        self.reset(maxOffset)
+
+    def reset(self, maxOffset=None, offset=None):
+        """
+        Clear the window and draw a new start offset for the next run
+
+        Parameters
+        ----------
+          - maxOffset: The largest start offset that can be drawn. If None,
+            the previous value is reused. Negative values are treated as 0
+          - offset: Use this start offset instead of drawing one, e.g. the
+            nLead of a CommunicationsTransmitter that already applies the
+            window offset
+        """
+        if maxOffset is not None:
+            self.maxOffset = max(int(maxOffset), 0)
+        if offset is None:
+            offset = self.rng.integers(0, self.maxOffset, endpoint=True)
+        self.offset = int(offset)
+        self.nItemsSeen = 0
+        self.nFilled = 0
+        self.buffer[:] = 0
+
+    def work(self, input_items, output_items):
+        samples = input_items[0]
+        nInput = len(samples)
+        # Part of this chunk that falls within the window
+        start = max(self.offset + self.nFilled - self.nItemsSeen, 0)
+        stop = min(self.offset + self.nSamps - self.nItemsSeen, nInput)
+        if stop > start:
+            self.buffer[self.nFilled:self.nFilled+stop-start] = samples[start:stop]
+            self.nFilled += stop - start
+        self.nItemsSeen += nInput
+        if self.nFilled == self.nSamps:
+            return -1
+        return nInput
+
+    def data(self):
+        """
+        Return a read-only view of the captured window. Samples that were not
+        filled because the stream ended early are zero. The view is
+        overwritten by the next run, so copy it to keep it.
+        """
+        view = self.buffer.view()
+        view.flags.writeable = False
+        return view
+
+
+def cut_window(samples, offset, nSamps):
+    """
+    Cut a window out of the samples captured by a vector sink
+
+    Parameters
+    ----------
+      - samples: The captured samples, e.g. blocks.vector_sink_c().data()
+      - offset: The start of the window
+      - nSamps: The number of samples in the window
+
+    Returns
+    -------
+      - window: An (nSamps,) complex64 array. As in WindowSink, samples past
+        the end of the capture are zero
+    """
+    window = np.zeros((nSamps,), dtype=COMPLEX_DTYPE)
+    part = np.asarray(samples[offset:offset+nSamps], dtype=COMPLEX_DTYPE)
+    window[:len(part)] = part
+    return window
@@ -0,0 +1,44 @@
+"""
+The BatchChannel against the GNU Radio channel models
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip('gnuradio')
+
+from gnuradio import gr, blocks, channels
+from signals.channel import BatchChannel
+
+
+def make_channel(delays, nTaps):
+    return BatchChannel(20e6, 0.01, 50, .01, 0.5e3, 8, 1, True, 4, delays,
+                        np.ones(len(delays)), nTaps)
+
+
+@pytest.mark.parametrize('delay', [0.0, 0.9, 1.3, 2.5])
+def test_path_taps_match_selective_fading_model(delay):
+    nTaps = 8
+    # Without Doppler the fader gain is a constant complex scalar, so the
+    # impulse response of a single path is its interpolation filter scaled
+    # by that gain
+    fader = channels.selective_fading_model(8, 0.0, False, 4.0, 1234,
+                                            [delay], [1.0], nTaps)
+    impulse = np.zeros(4*nTaps, dtype=np.complex64)
+    impulse[0] = 1
+    tb = gr.top_block()
+    source = blocks.vector_source_c(impulse.tolist(), False)
+    sink = blocks.vector_sink_c()
+    tb.connect(source, fader, sink)
+    tb.run()
+    response = np.array(sink.data(), dtype=np.complex64)[:nTaps]
+    taps = make_channel([delay], nTaps).pathTaps[0]
+    peak = np.argmax(np.abs(taps))
+    # selective_fading_model evaluates sin(x)/x from a lookup table
+    np.testing.assert_allclose(response / response[peak], taps / taps[peak],
+                               atol=1e-3)
+
+
+def test_path_taps_are_half_band():
+    taps = make_channel([0.0, 1.0], 8).pathTaps
+    np.testing.assert_allclose(taps[0, :3], [1, 2/np.pi, 0], atol=1e-12)
+    np.testing.assert_allclose(taps[1, :3], [2/np.pi, 1, 2/np.pi], atol=1e-12)
@@ -0,0 +1,34 @@
+"""
+Opening recordings with SigMFDataset
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip('sigmf')
+
+from sigmf import SigMFFile
+from signals.dataset import SigMFDataset
+from signals.storage import SigMFWriter
+
+
+@pytest.mark.parametrize('index', [True, False])
+def test_empty_recording(tmp_path, index):
+    filename = str(tmp_path / 'empty')
+    SigMFWriter(filename, {}, index=index).close()
+    dataset = SigMFDataset(filename)
+    assert len(dataset) == 0
+    assert dataset.batch(slice(None)).shape[0] == 0
+    assert len(dataset.classes) == 0
+
+
+def test_recording(tmp_path):
+    filename = str(tmp_path / 'dataset')
+    data = (np.arange(6*16) + 1j).astype(np.complex64).reshape(6, 16)
+    with SigMFWriter(filename, {}) as writer:
+        writer.append(data[:4], {SigMFFile.LABEL_KEY: 'LFM'})
+        writer.append(data[4:], {SigMFFile.LABEL_KEY: 'QPSK'})
+    dataset = SigMFDataset(filename)
+    assert len(dataset) == 6
+    assert dataset.nSamps == 16
+    np.testing.assert_array_equal(dataset.vectors, data)
+    np.testing.assert_array_equal(dataset.labelIds, [0]*4 + [1]*2)
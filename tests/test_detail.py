@@ -0,0 +1,28 @@
+"""
+Serializing waveform metadata
+"""
+import pytest
+
+pytest.importorskip('gnuradio')
+
+from signals.constellation import registry
+from signals.detail import detail
+from signals.waveform import qam16
+
+
+def test_dict_leaves_detail_unchanged():
+    d = detail()
+    d.type = 'digital'
+    d.modulation = 'psk'
+    d.order = 4
+    assert d.dict() == {'type': 'digital', 'class': 'psk', 'order': 4}
+    assert d.dict() == {'type': 'digital', 'class': 'psk', 'order': 4}
+    assert d.modulation == 'psk'
+    assert d.bandwidth is None
+
+
+def test_modulator_after_serializing_metadata():
+    sig = qam16()
+    sig.detail.noise_voltage = '0.0'
+    sig.detail.dict()
+    assert registry.numpy_modulator(sig) is registry.numpy_modulator(qam16())
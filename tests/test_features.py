@@ -0,0 +1,51 @@
+"""
+Caching of engineered features
+"""
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('sigmf')
+
+from sigmf import SigMFFile
+from signals.dataset import SigMFDataset
+from signals.features import FeatureStore, cumulants
+from signals.storage import SigMFWriter
+
+
+def write_recording(filename, seed):
+    rng = np.random.default_rng(seed)
+    data = (rng.standard_normal((8, 64)) +
+            1j*rng.standard_normal((8, 64))).astype(np.complex64)
+    with SigMFWriter(filename, {}) as writer:
+        writer.append(data, {SigMFFile.LABEL_KEY: 'Noise'})
+    return data
+
+
+def test_features_are_cached(tmp_path):
+    filename = str(tmp_path / 'dataset')
+    data = write_recording(filename, 0)
+    store = FeatureStore(SigMFDataset(filename))
+    features = store.get('cumulants', [1, 3, 5])
+    np.testing.assert_allclose(features, cumulants(data[[1, 3, 5]]))
+    path = store.path('cumulants', [1, 3, 5])
+    # Reopening keeps the stored features
+    store = FeatureStore(SigMFDataset(filename))
+    assert os.path.exists(path)
+    np.testing.assert_array_equal(store.get('cumulants', [1, 3, 5]), features)
+
+
+def test_features_are_discarded_when_the_recording_changes(tmp_path):
+    filename = str(tmp_path / 'dataset')
+    write_recording(filename, 0)
+    store = FeatureStore(SigMFDataset(filename))
+    store.get('cumulants')
+    path = store.path('cumulants')
+    data = write_recording(filename, 1)
+    # Make sure the modification time changes on coarse clocks
+    stat = os.stat(filename + '.sigmf-data')
+    os.utime(filename + '.sigmf-data',
+             ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    store = FeatureStore(SigMFDataset(filename))
+    assert not os.path.exists(path)
+    np.testing.assert_allclose(store.get('cumulants'), cumulants(data))
@@ -0,0 +1,104 @@
+"""
+The columnar DatasetIndex and the stratified DatasetSplit
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip('sigmf')
+
+from signals.index import DatasetIndex, DatasetSplit
+
+
+def make_index():
+    index = DatasetIndex()
+    lfm = {'type': 'analog', 'class': 'fm', 'noise_voltage': '-20.0'}
+    qpsk = {'type': 'digital', 'class': 'psk', 'order': 4,
+            'noise_voltage': '0.0'}
+    index.append(0, 3, 128, 'LFM', lfm)
+    index.append(3*128, 2, 128, 'QPSK', qpsk, {'seid': 7})
+    index.append(5*128, 4, 128, 'LFM', lfm)
+    index.append(9*128, 1, 128, 'Noise')
+    return index
+
+
+def test_index_columns():
+    index = make_index()
+    assert len(index) == 10
+    np.testing.assert_array_equal(index.start, 128*np.arange(10))
+    assert index.labels == ['LFM', 'QPSK', 'Noise']
+    assert len(index.details) == 2
+    np.testing.assert_array_equal(
+        index.label_names(), ['LFM']*3 + ['QPSK']*2 + ['LFM']*4 + ['Noise'])
+    np.testing.assert_array_equal(index.detailId, [0]*3 + [1]*2 + [0]*4 + [-1])
+    np.testing.assert_array_equal(index.emitterId, [-1]*3 + [0]*2 + [-1]*5)
+    np.testing.assert_array_equal(
+        index.noiseVoltage, [-20]*3 + [0]*2 + [-20]*4 + [np.nan])
+
+
+def test_index_round_trip(tmp_path):
+    index = make_index()
+    filename = str(tmp_path / 'dataset')
+    index.save(filename)
+    loaded = DatasetIndex.load(filename)
+    for name in ('start', 'length', 'labelId', 'noiseVoltage', 'detailId',
+                 'emitterId'):
+        column, loadedColumn = getattr(index, name), getattr(loaded, name)
+        np.testing.assert_array_equal(loadedColumn, column)
+        assert loadedColumn.dtype == column.dtype
+    assert loaded.labels == index.labels
+    assert loaded.details == index.details
+    assert loaded.emitters == index.emitters
+    # Appending to a loaded index reuses its interned records
+    loaded.append(10*128, 2, 128, 'QPSK', index.details[1])
+    assert len(loaded) == 12
+    assert loaded.labels == index.labels
+    assert len(loaded.details) == 2
+    np.testing.assert_array_equal(loaded.detailId[-2:], [1, 1])
+
+
+def make_strata():
+    # Strata of uneven sizes, in an interleaved order
+    rng = np.random.default_rng(0)
+    labelIds = rng.integers(0, 4, 3000)
+    noiseVoltages = rng.choice([-20.0, 0.0, 20.0], 3000)
+    return labelIds, noiseVoltages
+
+
+@pytest.mark.parametrize('fractions', [
+    {'train': 0.5, 'test': 0.5},
+    {'train': 0.7, 'validation': 0.1, 'test': 0.2},
+])
+def test_split_is_stratified(fractions):
+    labelIds, noiseVoltages = make_strata()
+    split = DatasetSplit.stratified(labelIds, noiseVoltages, fractions, seed=3)
+    everything = np.concatenate([split[name] for name in fractions])
+    np.testing.assert_array_equal(np.sort(everything), np.arange(3000))
+    for name, fraction in fractions.items():
+        indices = split[name]
+        assert indices.dtype == np.int32
+        assert np.all(np.diff(indices) > 0)
+        # Every (label, noise voltage) pair gets its share of the partition
+        for label in range(4):
+            for voltage in (-20.0, 0.0, 20.0):
+                stratum = (labelIds == label) & (noiseVoltages == voltage)
+                nStratum = np.count_nonzero(stratum)
+                nPartition = np.count_nonzero(stratum[indices])
+                assert abs(nPartition - fraction*nStratum) <= 1
+
+
+def test_split_is_reproducible(tmp_path):
+    labelIds, noiseVoltages = make_strata()
+    fractions = {'train': 0.8, 'test': 0.2}
+    split = DatasetSplit.stratified(labelIds, noiseVoltages, fractions, seed=3)
+    same = DatasetSplit.stratified(labelIds, noiseVoltages, fractions, seed=3)
+    other = DatasetSplit.stratified(labelIds, noiseVoltages, fractions, seed=4)
+    np.testing.assert_array_equal(same['train'], split['train'])
+    assert not np.array_equal(other['train'], split['train'])
+    filename = str(tmp_path / 'dataset')
+    split.save(filename)
+    loaded = DatasetSplit.load(filename)
+    assert loaded.fractions == fractions
+    assert loaded.seed == 3
+    for name in fractions:
+        np.testing.assert_array_equal(loaded[name], split[name])
+        assert loaded[name].dtype == np.int32
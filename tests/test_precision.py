@@ -0,0 +1,37 @@
+"""
+The helpers of the complex64/float32 precision policy
+"""
+import numpy as np
+import pytest
+from signals.precision import COMPLEX_DTYPE, as_complex, normalize_energy, \
+    phasor
+
+
+@pytest.mark.parametrize('data', [
+    np.ones(16, dtype=np.float64),
+    np.ones(16, dtype=np.complex128),
+    [1, 2, 3],
+])
+def test_as_complex(data):
+    assert as_complex(data).dtype == COMPLEX_DTYPE
+
+
+def test_as_complex_does_not_copy():
+    data = np.ones(16, dtype=COMPLEX_DTYPE)
+    assert as_complex(data) is data
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_phasor(dtype):
+    phase = np.linspace(-np.pi, np.pi, 64, dtype=dtype)
+    out = phasor(phase)
+    assert out.dtype == COMPLEX_DTYPE
+    np.testing.assert_allclose(out, np.exp(1j*phase), atol=1e-6)
+
+
+def test_normalize_energy():
+    data = np.full((4, 32), 3+4j, dtype=COMPLEX_DTYPE)
+    out = normalize_energy(data)
+    assert out is data
+    assert out.dtype == COMPLEX_DTYPE
+    np.testing.assert_allclose(np.sum(np.abs(out)**2, axis=1), 1, rtol=1e-6)
@@ -0,0 +1,68 @@
+"""
+The complex64/float32 precision policy, checked at every stage boundary
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip('gnuradio')
+pytest.importorskip('sigmf')
+
+from signals.channel import BatchChannel
+from signals.dataset import to_iq
+from signals.modulator import NumpyModulator
+from signals.precision import COMPLEX_DTYPE, REAL_DTYPE
+from signals.synthesis import DatasetSynthesizer
+from signals.waveform import LinearFMWaveform, SquareWaveform, qpsk
+
+SAMP_RATE = 20e6
+
+
+def make_channel():
+    return BatchChannel(SAMP_RATE, 0.01, 50, .01, 0.5e3, 8, 1, True, 4,
+                        [0.0, 0.9, 1.3], [1, 0.99, 0.97], 8)
+
+
+def test_to_iq():
+    iq = to_iq(np.ones((4, 32), dtype=COMPLEX_DTYPE))
+    assert iq.dtype == REAL_DTYPE
+    assert iq.shape == (4, 2, 32)
+
+
+@pytest.mark.parametrize('wave', [LinearFMWaveform, SquareWaveform])
+def test_radar_sample(wave):
+    sig = wave(bandwidth=10e6, pulsewidth=10e-6, sampRate=SAMP_RATE)
+    assert sig.sample().dtype == COMPLEX_DTYPE
+    batch = wave.sample_batch([1e6, 10e6], [1e-6, 10e-6], 256, SAMP_RATE)
+    assert batch.dtype == COMPLEX_DTYPE
+    assert batch.shape == (2, 256)
+
+
+def test_batch_channel_apply():
+    data = np.ones((4, 128), dtype=COMPLEX_DTYPE)
+    out = make_channel().apply(data, [0.0, 0.1, 1.0, 10.0], seeds=0)
+    assert out.dtype == COMPLEX_DTYPE
+    assert out.shape == data.shape
+
+
+def test_numpy_modulator_sample_batch():
+    modulator = qpsk().modulator()
+    out = modulator.sample_batch(8, 256, seed=0)
+    assert out.dtype == COMPLEX_DTYPE
+    assert out.shape == (8, 256)
+
+
+def test_numpy_modulator_from_points():
+    points = np.exp(1j*np.pi/4*(2*np.arange(4)+1))
+    modulator = NumpyModulator(points, sampsPerSym=2)
+    out = modulator.sample_batch(8, 256, seed=0)
+    assert out.dtype == COMPLEX_DTYPE
+
+
+@pytest.mark.parametrize('wave', [LinearFMWaveform, qpsk])
+def test_synthesize_shard(wave):
+    synthesizer = DatasetSynthesizer(waveforms=[wave], noiseVoltages=[0.1],
+                                     nVecClass=4, nSampsVec=128,
+                                     channel=make_channel())
+    data, metadata = synthesizer.synthesize_shard(synthesizer.shards()[0])
+    assert data.dtype == COMPLEX_DTYPE
+    assert data.shape == (4, 128)
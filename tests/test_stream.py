@@ -0,0 +1,60 @@
+"""
+Error handling of the synthetic training stream
+"""
+import os
+import pytest
+
+pytest.importorskip('gnuradio')
+pytest.importorskip('sigmf')
+
+from signals.stream import BatchGenerator, SyntheticStream
+from signals.waveform import LinearFMWaveform, SquareWaveform
+
+
+class FailingGenerator(BatchGenerator):
+    """
+    Raises on the second batch of every worker
+    """
+
+    def generate(self, batchId):
+        if batchId >= 2:
+            raise ValueError(f'Bad parameters in batch {batchId}')
+        return super().generate(batchId)
+
+
+class DyingGenerator(BatchGenerator):
+    """
+    Exits without raising, like a worker killed by the system
+    """
+
+    def generate(self, batchId):
+        os._exit(3)
+
+
+def make_stream(cls):
+    generator = cls(waveforms=[LinearFMWaveform, SquareWaveform],
+                    batchSize=8, nSampsVec=64)
+    return SyntheticStream(generator, nWorkers=2, queueSize=2)
+
+
+def test_batches():
+    with make_stream(BatchGenerator) as stream:
+        x, y = next(iter(stream))
+    assert x.shape == (8, 2, 64)
+    assert y.shape == (8, 2)
+
+
+def test_worker_exception_is_raised():
+    stream = make_stream(FailingGenerator)
+    with pytest.raises(ValueError, match='Bad parameters'):
+        for _ in stream:
+            pass
+    assert not stream.workers
+
+
+def test_dead_worker_is_reported():
+    stream = make_stream(DyingGenerator)
+    with pytest.raises(RuntimeError, match='exited with code 3'):
+        for _ in stream:
+            pass
+    assert not stream.workers
@@ -0,0 +1,76 @@
+"""
+Determinism of the sharded dataset synthesis
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip('gnuradio')
+pytest.importorskip('sigmf')
+
+from signals.channel import BatchChannel
+from signals.index import DatasetIndex
+from signals.synthesis import DatasetSynthesizer
+from signals.waveform import LinearFMWaveform, SquareWaveform, qpsk, qam16
+
+
+def make_synthesizer(shardSize):
+    channel = BatchChannel(20e6, 0.01, 50, .01, 0.5e3, 8, 1, True, 4,
+                           [0.0, 0.9, 1.3], [1, 0.99, 0.97], 8)
+    return DatasetSynthesizer(
+        waveforms=[LinearFMWaveform, SquareWaveform, qpsk, qam16],
+        noiseVoltages=[0.0, 0.1, 1.0], nVecClass=7, nSampsVec=64,
+        channel=channel, nSampsSource=256, seed=1234, shardSize=shardSize)
+
+
+def read_recording(filename):
+    data = np.fromfile(str(filename) + '.sigmf-data', dtype='<c8')
+    return data, DatasetIndex.load(str(filename))
+
+
+@pytest.mark.parametrize('shardSize, nWorkers', [(3, 1), (7, 2), (2, 3)])
+def test_independent_of_shards_and_workers(tmp_path, shardSize, nWorkers):
+    make_synthesizer(7).run(str(tmp_path / 'reference'), nWorkers=1)
+    make_synthesizer(shardSize).run(str(tmp_path / 'dataset'),
+                                    nWorkers=nWorkers)
+    refData, refIndex = read_recording(tmp_path / 'reference')
+    data, index = read_recording(tmp_path / 'dataset')
+    assert len(refData) == 3*4*7*64
+    np.testing.assert_array_equal(data, refData)
+    np.testing.assert_array_equal(index.label_names(),
+                                  refIndex.label_names())
+    np.testing.assert_array_equal(index.noiseVoltage, refIndex.noiseVoltage)
+
+
+def test_shards_independent_of_grid():
+    synthesizer = make_synthesizer(7)
+    # The same (noise voltage, waveform) pair at another grid position
+    other = make_synthesizer(7)
+    other.waveforms = other.waveforms[::-1]
+    other.noiseVoltages = other.noiseVoltages[::-1]
+    data, _ = synthesizer.synthesize_shard((1, 2, 0, 7))
+    otherData, _ = other.synthesize_shard((1, 1, 0, 7))
+    np.testing.assert_array_equal(data, otherData)
+
+
+def test_seed_changes_output():
+    synthesizer = make_synthesizer(7)
+    data, _ = synthesizer.synthesize_shard((1, 2, 0, 7))
+    synthesizer.seed += 1
+    otherData, _ = synthesizer.synthesize_shard((1, 2, 0, 7))
+    assert not np.array_equal(data, otherData)
+
+
+def test_profiled_run_does_not_duplicate_parent_stages(tmp_path):
+    from signals.profiling import profiler
+    profiler.reset()
+    profiler.enable()
+    try:
+        with profiler.stage('parent.setup'):
+            pass
+        make_synthesizer(2).run(str(tmp_path / 'dataset'), nWorkers=2)
+        names = [event[0] for event in profiler.events]
+    finally:
+        profiler.disable()
+        profiler.reset()
+    assert names.count('parent.setup') == 1
+    assert names.count('synthesis.shard') == len(make_synthesizer(2).shards())